@@ -0,0 +1,100 @@
+﻿import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+ARCHIVE_FILE = "archive.db"
+HASH_CHUNK = 1024 * 1024
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# --------------------
+# 下载存档：记录已下载的视频，下载前先查；内容相同的文件用硬链接只存一份
+# --------------------
+class DownloadArchive:
+    def __init__(self, path=ARCHIVE_FILE):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                site TEXT, video_id TEXT, format_id TEXT, path TEXT PRIMARY KEY,
+                size INTEGER, sha256 TEXT, created REAL);
+            CREATE INDEX IF NOT EXISTS idx_downloads_video ON downloads (site, video_id, format_id);
+            CREATE INDEX IF NOT EXISTS idx_downloads_hash ON downloads (sha256, size);
+            CREATE TABLE IF NOT EXISTS names (
+                folder TEXT, base TEXT, ext TEXT, seq INTEGER, PRIMARY KEY (folder, base, ext));
+        """)
+        self._db.commit()
+
+    def lookup(self, site, video_id, format_id=None):
+        # 找到仍然存在的已下载文件路径；文件被删掉的记录顺手清理
+        sql = "SELECT path FROM downloads WHERE site = ? AND video_id = ?"
+        params = [site, str(video_id)]
+        if format_id is not None:
+            sql += " AND format_id = ?"
+            params.append(format_id)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+            for (path,) in rows:
+                if os.path.exists(path):
+                    return path
+            if rows:
+                self._db.executemany("DELETE FROM downloads WHERE path = ?", rows)
+                self._db.commit()
+        return None
+
+    def allocate_path(self, folder, base, ext):
+        # 从索引里按序号分配文件名（name.mp4 / name (1).mp4 ...），分配即占用，并发任务不会拿到同一个；
+        # 正常情况下只需要一次 stat，用来避开存档之外已有的同名文件。序号只增不减：文件被删掉后空出的名字不再分配
+        folder = os.path.abspath(folder)
+        with self._lock:
+            row = self._db.execute("SELECT seq FROM names WHERE folder = ? AND base = ? AND ext = ?",
+                                   (folder, base, ext)).fetchone()
+            seq = -1 if row is None else row[0]
+            while True:
+                seq += 1
+                name = f"{base}.{ext}" if seq == 0 else f"{base} ({seq}).{ext}"
+                path = os.path.join(folder, name)
+                if not os.path.exists(path):
+                    break
+            self._db.execute("INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?)", (folder, base, ext, seq))
+            self._db.commit()
+        return path
+
+    def record(self, site, video_id, format_id, path):
+        # 下载完成后登记；已有相同内容的文件时把新文件换成指向它的硬链接，返回 (路径, 是否去重)
+        size = os.path.getsize(path)
+        digest = file_sha256(path)
+        deduped = False
+        with self._lock:
+            for (existing,) in self._db.execute(
+                    "SELECT path FROM downloads WHERE sha256 = ? AND size = ? AND path != ?",
+                    (digest, size, path)).fetchall():
+                if os.path.exists(existing) and _replace_with_link(existing, path):
+                    deduped = True
+                    break
+            self._db.execute("INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (site, str(video_id), format_id, path, size, digest, time.time()))
+            self._db.commit()
+        return path, deduped
+
+
+def _replace_with_link(existing, path):
+    if os.path.samefile(existing, path):
+        return True
+    tmp = path + ".link"
+    try:
+        os.link(existing, tmp)
+    except OSError:
+        # 跨盘或文件系统不支持硬链接时保留原文件
+        return False
+    os.replace(tmp, path)
+    return True
@@ -0,0 +1,175 @@
+﻿import re
+import threading
+
+from 解析缓存 import download_with_cache, extract_cache
+from 任务队列 import JobCancelled, DOWNLOADING, MERGING
+from 带宽调度 import bandwidth
+from 任务指标 import job_metrics
+from 会话池 import sessions, site_of
+from 重试熔断 import resilience
+from 分片下载 import FragmentStats, FragmentLogger, fragment_tuner, fragment_backoff, FRAGMENT_RETRIES
+
+# --------------------
+# 解析 / 选格式 / 下载（GUI 与命令行共用，不依赖 Tk）
+# --------------------
+def sanitize_filename(name):
+    name = re.sub(r'[\\/:*?"<>|]', '', name)
+    return name.strip()
+
+
+def format_size(size, approx=False):
+    import humanize
+    if not size:
+        return "未知大小"
+    return ("≈" if approx else "") + humanize.naturalsize(size)
+
+
+def collect_formats(info):
+    # 所有带画面的 MP4 版本；没有大小的可以交给 大小探测.size_prober 后台补上
+    valid_formats = []
+    for f in info.get("formats") or []:
+        if f.get("vcodec") != 'none' and f.get("ext") == "mp4":
+            filesize = f.get("filesize") or f.get("filesize_approx") or 0
+            valid_formats.append({
+                "id": f["format_id"],
+                "res": f.get("resolution") or f"{f.get('width')}x{f.get('height')}",
+                "height": f.get("height") or 0,
+                "width": f.get("width") or 0,
+                "size_bytes": filesize,
+                "size_str": format_size(filesize, approx=not f.get("filesize")),
+                "tbr": f.get("tbr") or 0
+            })
+    return valid_formats
+
+
+def best_per_resolution(formats, key="height"):
+    # 同分辨率只留码率最高的一个，按分辨率从高到低排
+    unique_formats = {}
+    for f in formats:
+        k = f[key]
+        if k not in unique_formats or f["tbr"] > unique_formats[k]["tbr"]:
+            unique_formats[k] = f
+    return sorted(unique_formats.values(), key=lambda x: (x["height"], x["width"]), reverse=True)
+
+
+def select_format(formats, max_height=None, max_size=None, fallback_smallest=False):
+    # 命令行的格式策略：不超过 max_height / max_size 的最高画质；大小未知的不受 max_size 限制。
+    # 都不满足时返回 None，由调用方报告；fallback_smallest 为真时才退而求其次取最小的那个
+    candidates = [f for f in best_per_resolution(formats)
+                  if (not max_height or f["height"] <= max_height)
+                  and (not max_size or not f["size_bytes"] or f["size_bytes"] <= max_size)]
+    if candidates:
+        return candidates[0]
+    ordered = best_per_resolution(formats)
+    return ordered[-1] if ordered and fallback_smallest else None
+
+
+def format_string(fmt_id, merge_audio):
+    return f"{fmt_id}+bestaudio/best" if merge_audio else f"{fmt_id}/best"
+
+
+def media_host(url, fmt_str):
+    # 下载出错记在实际提供媒体的主机（CDN）上，不连累同站点的解析；还没有解析结果时单独记一个“站点的媒体”
+    info = extract_cache.get(url) or {}
+    fmt_id = re.split(r"[+/]", fmt_str, 1)[0]
+    for f in info.get("formats") or []:
+        if f.get("format_id") == fmt_id and f.get("url"):
+            return site_of(f["url"])
+    return f"media:{site_of(url)}"
+
+
+def download_video(job, url, fmt_str, outtmpl, ffmpeg_path=None, on_progress=None, fragments=None):
+    # 在任务线程里下载，返回最终文件路径；on_progress(d) 给界面刷新状态用；
+    # HLS/DASH 分片并发按站点自适应，分片耗时等统计写进 fragments（FragmentStats）
+    result = {}
+    received = {"bytes": None}
+    received_lock = threading.Lock()
+    if fragments is None:
+        fragments = FragmentStats()
+    fragments.concurrency = fragment_tuner.concurrency(url)
+    # 分阶段计时：下载（字节数、平均/峰值速度、重试次数），合并单独一段
+    metrics = job_metrics(job)
+    totals = {"bytes": 0, "peak": 0.0}
+    stages = {"download": metrics.begin("download", format=fmt_str)}
+
+    def progress_hook(d):
+        job.checkpoint()
+        fragments.on_progress(d)
+        if d['status'] == 'downloading':
+            downloaded = d.get('downloaded_bytes') or 0
+            # 按这次回调新收到的字节向全局带宽调度要令牌，限速时在这里阻塞下载线程；
+            # 续传时第一次回调里的字节是之前下好的，不计
+            with received_lock:
+                last = downloaded if received["bytes"] is None else received["bytes"]
+                delta = downloaded - last
+                received["bytes"] = max(last, downloaded)
+            bandwidth.consume(job, delta)
+            totals["peak"] = max(totals["peak"], d.get('speed') or 0.0)
+            total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+            job.update(progress=downloaded * 100.0 / total if total else None,
+                       downloaded_bytes=downloaded, total_bytes=total, speed=d.get('speed') or 0.0)
+        elif d['status'] == 'finished':
+            total = d.get('total_bytes') or d.get('downloaded_bytes') or 0
+            job.update(progress=100, downloaded_bytes=total, total_bytes=total, speed=0.0)
+            result["path"] = d.get("filename")
+            totals["bytes"] += total
+            with received_lock:
+                received["bytes"] = None
+        if on_progress:
+            on_progress(d)
+
+    def end_download():
+        entry = stages["download"]
+        seconds = metrics.elapsed(entry)
+        metrics.end(entry, bytes=totals["bytes"], peak_speed=round(totals["peak"]),
+                    avg_speed=round(totals["bytes"] / seconds) if seconds else 0,
+                    retries=sum(fragments.errors.values()), fragments=fragments.count)
+
+    def postprocessor_hook(d):
+        if d['status'] == 'started' and d.get('postprocessor') == 'Merger':
+            end_download()
+            stages["merge"] = metrics.begin("merge")
+            job.update(state=MERGING)
+        elif d['status'] == 'finished' and d.get('info_dict', {}).get('filepath'):
+            result["path"] = d['info_dict']['filepath']
+
+    ydl_opts = {
+        "format": fmt_str,
+        "outtmpl": outtmpl,
+        "progress_hooks": [progress_hook],
+        "postprocessor_hooks": [postprocessor_hook],
+        "quiet": True,
+        "no_warnings": True,
+        "noprogress": True,
+        "logger": FragmentLogger(fragments),
+        "concurrent_fragment_downloads": fragments.concurrency,
+        "fragment_retries": FRAGMENT_RETRIES,
+        "retry_sleep_functions": {"fragment": fragment_backoff, "http": fragment_backoff},
+    }
+    if ffmpeg_path:
+        ydl_opts["ffmpeg_location"] = ffmpeg_path
+
+    job.update(state=DOWNLOADING, progress=0)
+    import yt_dlp
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            # 下载要挂本任务的回调，单独建实例，但 cookie 和解析时的会话共用
+            sessions.attach(ydl, url)
+            # 限流和网络错误退避后重试（.part 文件接着续传），站点熔断时先暂停
+            resilience.call(url, download_with_cache, ydl, url, job=job, host=media_host(url, fmt_str))
+    except Exception as e:
+        for entry in stages.values():
+            if "seconds" not in entry:
+                entry["error"] = "cancelled" if job.cancelled else str(e)
+        # yt-dlp 可能把回调里抛出的取消异常包装成 DownloadError
+        if job.cancelled:
+            raise JobCancelled()
+        raise
+    finally:
+        end_download()
+        if "merge" in stages:
+            metrics.end(stages["merge"])
+        bandwidth.forget(job)
+        if not job.cancelled and (fragments.count or fragments.errors):
+            fragment_tuner.report(url, fragments)
+    return result.get("path")
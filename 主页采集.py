@@ -0,0 +1,87 @@
+﻿import itertools
+
+from 会话池 import sessions, BASE_OPTS
+from 解析缓存 import video_key
+
+HARVEST_AHEAD = 8        # 采集最多跑在下载前面多少个条目，超过就等下载追上来
+CHECKPOINT_EVERY = 10    # 每交出多少个条目把采集位置写进任务日志
+MAX_REDIRECTS = 5        # 短链 / 跳转类解析结果最多跟几层
+PAGE_WINDOW = 50         # 分页列表每次取多少个条目
+
+
+def entry_url(entry):
+    return entry.get("webpage_url") or entry.get("url")
+
+
+def entry_key(entry):
+    # 存档里的 (站点, id)：条目带了解析器名和 id 就直接用，否则从链接里认
+    site = entry.get("ie_key") or entry.get("extractor_key")
+    if site and entry.get("id"):
+        return site.lower(), str(entry["id"])
+    url = entry_url(entry)
+    return video_key(url) if url else None
+
+
+def _iter_entries(entries, start):
+    # 从第 start 个条目开始逐个取：分页列表每次用 getslice 取一小段（只请求用到的页），生成器边走边丢。
+    # PagedList 默认把取过的每一页都缓存着，走完一段就丢掉已经走过的页，只留下一段可能还要用的那一页
+    from yt_dlp.utils import PagedList
+    if not isinstance(entries, PagedList):
+        yield from itertools.islice(entries, start, None)
+        return
+    while True:
+        window = entries.getslice(start, start + PAGE_WINDOW)
+        if not window:
+            return
+        start += len(window)
+        for page in [p for p in entries._cache if p < start // entries._pagesize]:
+            del entries._cache[page]
+        yield from window
+
+
+# --------------------
+# 主页 / 列表 / 搜索采集：yt-dlp 只解析出条目的生成器（不逐条解析、不先攒成列表），
+# 发现一个交出一个；存档里已有的跳过，采集位置定期写进任务日志，中断后从原位置接着枚举
+# --------------------
+class Harvester:
+    def __init__(self, journal, archive, app="cli"):
+        self.journal = journal
+        self.archive = archive
+        self.app = app
+
+    def _resolve(self, ydl, url):
+        result = ydl.extract_info(url, download=False, process=False)
+        for _ in range(MAX_REDIRECTS):
+            if result.get("_type") not in ("url", "url_transparent"):
+                break
+            result = ydl.extract_info(result["url"], download=False, process=False, ie_key=result.get("ie_key"))
+        return result
+
+    def walk(self, url, on_skip=None):
+        # 生成器：逐个给出待下载的条目链接；存档里已有的回调 on_skip(链接, 已有路径) 后跳过。
+        # 调用方拿到一个条目后应先登记（任务日志）再取下一个，位置只记到已交出的条目
+        import yt_dlp
+        start = self.journal.harvest_position(self.app, url)
+        with yt_dlp.YoutubeDL(dict(BASE_OPTS)) as ydl:
+            sessions.attach(ydl, url)
+            result = self._resolve(ydl, url)
+            entries = result.get("entries")
+            if entries is None:
+                # 不是列表，就是单个视频 / 笔记
+                yield entry_url(result) or url
+                self.journal.finish_harvest(self.app, url)
+                return
+            position = start
+            for entry in _iter_entries(entries, start):
+                position += 1
+                if entry and entry_url(entry):
+                    key = entry_key(entry)
+                    existing = self.archive.lookup(*key) if key else None
+                    if existing:
+                        if on_skip:
+                            on_skip(entry_url(entry), existing)
+                    else:
+                        yield entry_url(entry)
+                if position % CHECKPOINT_EVERY == 0:
+                    self.journal.save_harvest(self.app, url, position)
+        self.journal.finish_harvest(self.app, url)
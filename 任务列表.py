@@ -0,0 +1,187 @@
+﻿import threading
+import tkinter as tk
+from collections import OrderedDict
+from tkinter import ttk
+
+from 任务队列 import STATE_TEXT, DOWNLOADING, TRANSCODING, DONE, CANCELLED, FINISHED_STATES
+from 带宽调度 import bandwidth
+
+REFRESH_MS = 100   # 界面统一刷新间隔（10 Hz）
+FINISHED_KEEP_MS = 60 * 1000   # 完成 / 取消的任务在列表里留多久；失败的一直留着，等用户清除
+
+
+# --------------------
+# 线程安全的界面更新：工作线程只投递，主线程定时批量执行，同一个 key 只保留最新一次
+# --------------------
+class UiPump:
+    def __init__(self, root, interval_ms=REFRESH_MS):
+        self.root = root
+        self.interval_ms = interval_ms
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        root.after(interval_ms, self._drain)
+
+    def post(self, key, func, *args):
+        with self._lock:
+            self._pending.pop(key, None)
+            self._pending[key] = (func, args)
+
+    def _drain(self):
+        with self._lock:
+            items = list(self._pending.values())
+            self._pending.clear()
+        for func, args in items:
+            try:
+                func(*args)
+            except tk.TclError:
+                pass
+        self.root.after(self.interval_ms, self._drain)
+
+
+MB = 1024 * 1024
+
+
+# --------------------
+# 下载任务列表（每个任务一行，可暂停/继续/取消/优先），底部显示总速度和预计剩余时间
+# --------------------
+class JobListView:
+    def __init__(self, root, parent, job_queue, font=None, height=5, on_workers_changed=None,
+                 pump=None, progress=None, on_limit_changed=None):
+        self.root = root
+        self.job_queue = job_queue
+        self.on_workers_changed = on_workers_changed
+        self.on_limit_changed = on_limit_changed
+        self.pump = pump or UiPump(root)
+        self.progress = progress
+        self.rows = {}
+        self._expiring = set()
+
+        frame = tk.LabelFrame(parent, text="📥 下载任务", padx=5, pady=5, font=font)
+        frame.pack(fill="x", padx=10, pady=5)
+
+        self.tree = ttk.Treeview(frame, columns=("state", "progress", "speed"), height=height)
+        self.tree.heading("#0", text="文件")
+        self.tree.heading("state", text="状态")
+        self.tree.heading("progress", text="进度")
+        self.tree.heading("speed", text="速度")
+        self.tree.column("#0", width=180)
+        self.tree.column("state", width=80, anchor="center")
+        self.tree.column("progress", width=50, anchor="e")
+        self.tree.column("speed", width=80, anchor="e")
+        self.tree.pack(fill="x")
+
+        self.total_var = tk.StringVar(value="")
+        tk.Label(frame, textvariable=self.total_var, fg="#666666", font=font, anchor="w").pack(fill="x")
+
+        frame_btn = tk.Frame(frame)
+        frame_btn.pack(fill="x", pady=(5, 0))
+        tk.Button(frame_btn, text="⏸ 暂停", command=lambda: self._apply("pause"), font=font).pack(side="left")
+        tk.Button(frame_btn, text="▶ 继续", command=lambda: self._apply("resume"), font=font).pack(side="left", padx=5)
+        tk.Button(frame_btn, text="⛔ 取消", command=lambda: self._apply("cancel"), font=font).pack(side="left")
+        tk.Button(frame_btn, text="⏫ 优先", command=self._prioritize, font=font).pack(side="left", padx=5)
+        tk.Button(frame_btn, text="🧹 清除已结束", command=self.clear_finished, font=font).pack(side="left")
+        # 限速时选中的任务多分 / 少分一些带宽（权重每次翻倍或减半）
+        tk.Button(frame_btn, text="➕ 带宽", command=lambda: self._reweight(2.0), font=font).pack(side="left")
+        tk.Button(frame_btn, text="➖ 带宽", command=lambda: self._reweight(0.5), font=font).pack(side="left", padx=5)
+
+        tk.Label(frame_btn, text="同时下载:", font=font).pack(side="left", padx=(10, 0))
+        self.workers_var = tk.IntVar(value=job_queue.max_workers)
+        tk.Spinbox(frame_btn, from_=1, to=16, width=3, textvariable=self.workers_var,
+                   command=self._on_workers_changed, font=font).pack(side="left")
+
+        # 总限速（MB/s，0 为不限），所有下载共用
+        tk.Label(frame_btn, text="限速MB/s:", font=font).pack(side="left", padx=(10, 0))
+        self.limit_var = tk.IntVar(value=bandwidth.limit // MB)
+        tk.Spinbox(frame_btn, from_=0, to=1000, width=4, textvariable=self.limit_var,
+                   command=self._on_limit_changed, font=font).pack(side="left")
+
+        job_queue.add_listener(self.notify)
+
+    def notify(self, job):
+        # 任务线程里触发：只投递，主线程每 100ms 合并刷新一次
+        self.pump.post(("job", job.id), self._refresh, job)
+        self.pump.post("total", self._refresh_total)
+
+    def _refresh(self, job):
+        import humanize
+        state = STATE_TEXT.get(job.state, job.state)
+        if job.paused:
+            state = "⏸ 已暂停"
+        speed = humanize.naturalsize(job.speed) + "/s" if job.state == DOWNLOADING and job.speed else ""
+        if job.state == TRANSCODING:
+            # 转码时这一栏显示倍速和剩余时间
+            speed = job.message
+        if job.priority and job.state not in FINISHED_STATES:
+            state = "⏫ " + state
+        if job.weight != 1.0 and job.state not in FINISHED_STATES:
+            state += f" ×{job.weight:g}"
+        values = (state, f"{job.progress:.0f}%", speed)
+        if job.id in self.rows:
+            self.tree.item(self.rows[job.id], text=job.name, values=values)
+        elif job in self.job_queue.jobs:
+            self.rows[job.id] = self.tree.insert("", tk.END, text=job.name, values=values)
+        else:
+            # 已经清除的任务，晚到的刷新不再把行加回来
+            return
+        if job.state in (DONE, CANCELLED) and job.id not in self._expiring:
+            self._expiring.add(job.id)
+            self.root.after(FINISHED_KEEP_MS, self._forget, [job])
+
+    def _forget(self, jobs):
+        # 已结束的任务移出队列和列表，长时间开着程序也不会越积越多
+        for job in self.job_queue.prune(jobs):
+            self._expiring.discard(job.id)
+            iid = self.rows.pop(job.id, None)
+            if iid is not None and self.tree.exists(iid):
+                self.tree.delete(iid)
+
+    def clear_finished(self):
+        self._forget(list(self.job_queue.jobs))
+
+    def _refresh_total(self):
+        import humanize
+        active = [job for job in self.job_queue.jobs if job.state == DOWNLOADING]
+        speed = sum(job.speed for job in active)
+        done = sum(job.downloaded_bytes for job in active if job.total_bytes)
+        total = sum(job.total_bytes for job in active if job.total_bytes)
+        if self.progress is not None:
+            self.progress['value'] = done * 100.0 / total if total else 0
+        if not active:
+            self.total_var.set("")
+            return
+        eta = humanize.naturaldelta(max(total - done, 0) / speed) if speed and total else "未知"
+        self.total_var.set(f"下载中 {len(active)} 个 | 总速度 {humanize.naturalsize(speed)}/s | 剩余约 {eta}")
+
+    def _selected_jobs(self):
+        ids = set(self.tree.selection())
+        return [job for job in self.job_queue.jobs if self.rows.get(job.id) in ids]
+
+    def _apply(self, action):
+        for job in self._selected_jobs():
+            getattr(job, action)()
+
+    def _prioritize(self):
+        for job in self._selected_jobs():
+            self.job_queue.prioritize(job)
+
+    def _reweight(self, factor):
+        for job in self._selected_jobs():
+            self.job_queue.set_weight(job, job.weight * factor)
+
+    def _on_limit_changed(self):
+        try:
+            limit = max(0, int(self.limit_var.get())) * MB
+        except (tk.TclError, ValueError):
+            return
+        bandwidth.set_limit(limit)
+        if self.on_limit_changed:
+            self.on_limit_changed(limit)
+
+    def _on_workers_changed(self):
+        try:
+            n = int(self.workers_var.get())
+        except (tk.TclError, ValueError):
+            return
+        self.job_queue.set_max_workers(n)
+        if self.on_workers_changed:
+            self.on_workers_changed(n)
@@ -0,0 +1,198 @@
+﻿import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+from 任务队列 import FINISHED_STATES
+
+METRICS_FILE = "metrics.jsonl"
+PROM_FILE = "metrics.prom"
+PROM_PREFIX = "tuite"
+
+# 阶段耗时直方图的分桶（秒）
+STAGE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+# --------------------
+# 单个任务的分阶段计时：解析、翻译、选格式、下载、合并、转码、收尾，每段记起止时间和附加字段
+# --------------------
+class JobMetrics:
+    def __init__(self):
+        self.started = time.time()
+        self.stages = []
+        self.recorded = False
+        self._lock = threading.Lock()
+
+    def begin(self, name, **fields):
+        entry = {"stage": name, "start": round(time.time(), 3), **fields}
+        entry["_t0"] = time.perf_counter()
+        with self._lock:
+            self.stages.append(entry)
+        return entry
+
+    def end(self, entry, **fields):
+        with self._lock:
+            if "seconds" in entry:
+                return
+            entry.update(fields)
+            entry["end"] = round(time.time(), 3)
+            entry["seconds"] = round(time.perf_counter() - entry.pop("_t0"), 3)
+
+    def elapsed(self, entry):
+        with self._lock:
+            if "seconds" in entry:
+                return entry["seconds"]
+            return time.perf_counter() - entry["_t0"]
+
+    @contextmanager
+    def stage(self, name, **fields):
+        entry = self.begin(name, **fields)
+        try:
+            yield entry
+        except Exception as e:
+            entry["error"] = str(e) or type(e).__name__
+            raise
+        finally:
+            self.end(entry)
+
+    def snapshot(self):
+        with self._lock:
+            return [{k: v for k, v in entry.items() if not k.startswith("_")} for entry in self.stages]
+
+
+def job_metrics(job):
+    metrics = getattr(job, "metrics", None)
+    if metrics is None:
+        metrics = job.metrics = JobMetrics()
+    return metrics
+
+
+def stage(job, name, **fields):
+    # with stage(job, "extract"): ...   出错时把异常写进这一段再抛出
+    return job_metrics(job).stage(name, **fields)
+
+
+# --------------------
+# 指标汇总：每个任务结束写一行 JSON，同时维护各阶段的累计值，导出 Prometheus 文本格式
+# --------------------
+class MetricsRecorder:
+    def __init__(self, jsonl_path=METRICS_FILE, prom_path=PROM_FILE):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self._lock = threading.Lock()
+        self._stage_buckets = {}     # stage -> [各分桶计数]
+        self._stage_sum = {}
+        self._stage_count = {}
+        self._stage_errors = {}
+        self._jobs = {}              # 结果 -> 任务数
+        self._counters = {"download_bytes": 0, "download_retries": 0}
+        self._speed_factor = [0.0, 0]
+        self._peak_speed = 0.0
+
+    def configure(self, jsonl_path=None, prom_path=None):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+
+    def watch(self, job_queue):
+        job_queue.add_listener(self._on_job_update)
+
+    def _on_job_update(self, job):
+        if job.state in FINISHED_STATES:
+            self.finish(job)
+
+    def finish(self, job):
+        metrics = job_metrics(job)
+        with metrics._lock:
+            if metrics.recorded:
+                return
+            metrics.recorded = True
+        stages = metrics.snapshot()
+        record = {"job": job.id, "name": job.name, "result": job.state, "error": str(job.error) if job.error else None,
+                  "start": round(metrics.started, 3), "end": round(time.time(), 3),
+                  "seconds": round(time.time() - metrics.started, 3), "stages": stages}
+        with self._lock:
+            self._jobs[job.state] = self._jobs.get(job.state, 0) + 1
+            for entry in stages:
+                self._aggregate(entry)
+        self._write(record)
+
+    def observe(self, name, seconds, **fields):
+        # 不属于某个下载任务的单独一段（比如界面里的解析）
+        entry = {"stage": name, "end": round(time.time(), 3), "seconds": round(seconds, 3), **fields}
+        with self._lock:
+            self._aggregate(entry)
+        self._write({"event": name, **entry})
+
+    @contextmanager
+    def timed(self, name, **fields):
+        # with metrics.timed("extract", url=url): ...   计时后作为单独事件记录
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            fields["error"] = str(e) or type(e).__name__
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, **fields)
+
+    def _aggregate(self, entry):
+        name = entry["stage"]
+        seconds = entry.get("seconds")
+        if seconds is not None:
+            buckets = self._stage_buckets.setdefault(name, [0] * len(STAGE_BUCKETS))
+            for i, bound in enumerate(STAGE_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            self._stage_sum[name] = self._stage_sum.get(name, 0.0) + seconds
+            self._stage_count[name] = self._stage_count.get(name, 0) + 1
+        if entry.get("error"):
+            self._stage_errors[name] = self._stage_errors.get(name, 0) + 1
+        self._counters["download_bytes"] += entry.get("bytes") or 0
+        self._counters["download_retries"] += entry.get("retries") or 0
+        self._peak_speed = max(self._peak_speed, entry.get("peak_speed") or 0.0)
+        if entry.get("speed_factor"):
+            self._speed_factor[0] += entry["speed_factor"]
+            self._speed_factor[1] += 1
+
+    def _write(self, record):
+        with self._lock:
+            if self.jsonl_path:
+                try:
+                    with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                except OSError:
+                    pass
+            if self.prom_path:
+                self._write_prometheus()
+
+    def _write_prometheus(self):
+        # 先写临时文件再替换，node_exporter 之类读到的总是完整文件
+        p = PROM_PREFIX
+        lines = [f"# HELP {p}_stage_seconds 各阶段耗时", f"# TYPE {p}_stage_seconds histogram"]
+        for name, buckets in sorted(self._stage_buckets.items()):
+            for bound, count in zip(STAGE_BUCKETS, buckets):
+                lines.append(f'{p}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'{p}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {self._stage_count[name]}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{name}"}} {self._stage_sum[name]:.3f}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{name}"}} {self._stage_count[name]}')
+        lines += [f"# HELP {p}_stage_errors_total 各阶段出错次数", f"# TYPE {p}_stage_errors_total counter"]
+        lines += [f'{p}_stage_errors_total{{stage="{name}"}} {n}' for name, n in sorted(self._stage_errors.items())]
+        lines += [f"# HELP {p}_jobs_total 结束的任务数", f"# TYPE {p}_jobs_total counter"]
+        lines += [f'{p}_jobs_total{{result="{state}"}} {n}' for state, n in sorted(self._jobs.items())]
+        for key, value in self._counters.items():
+            lines += [f"# TYPE {p}_{key}_total counter", f"{p}_{key}_total {value}"]
+        lines += [f"# TYPE {p}_download_peak_speed_bytes gauge", f"{p}_download_peak_speed_bytes {self._peak_speed:.0f}"]
+        total, count = self._speed_factor
+        lines += [f"# TYPE {p}_transcode_speed_factor summary",
+                  f"{p}_transcode_speed_factor_sum {total:.3f}", f"{p}_transcode_speed_factor_count {count}"]
+        tmp = self.prom_path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp, self.prom_path)
+        except OSError:
+            pass
+
+
+metrics = MetricsRecorder()
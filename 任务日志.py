@@ -0,0 +1,138 @@
+﻿import json
+import time
+import sqlite3
+import threading
+
+from 任务队列 import DONE, FAILED, CANCELLED, FINISHED_STATES
+
+JOURNAL_FILE = "jobs.db"
+
+# 任务阶段
+STAGE_QUEUED = "queued"
+STAGE_DOWNLOADING = "downloading"
+STAGE_DOWNLOADED = "downloaded"     # 临时文件已下载完整，只差转码
+STAGE_TRANSCODING = "transcoding"
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+
+UNFINISHED_STAGES = (STAGE_QUEUED, STAGE_DOWNLOADING, STAGE_DOWNLOADED, STAGE_TRANSCODING)
+FAILED_RETENTION = 7 * 24 * 3600    # 失败的记录留多久（秒），方便事后查错误，过期在启动时清掉
+
+
+# --------------------
+# 任务日志：每个任务的链接、格式、输出路径和阶段都落盘，程序崩溃或被关掉后重启可以接着做
+# --------------------
+class JobJournal:
+    def __init__(self, path=JOURNAL_FILE):
+        self._lock = threading.Lock()
+        self._live = {}     # 记录 id -> 正在做它的任务
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, app TEXT, key TEXT, args TEXT,
+                stage TEXT, final_path TEXT, tmp_path TEXT, error TEXT, updated REAL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_app ON jobs (app, stage)")
+        # 主页 / 列表采集的进度：已交给下载队列的条目数
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS harvests (
+                app TEXT, url TEXT, position INTEGER, updated REAL, PRIMARY KEY (app, url))""")
+        self._db.commit()
+        self.purge_failed()
+
+    def add(self, app, key, args):
+        # 同一个 app + key 已有未完成记录时直接复用（重启后重新提交同一个链接也能接上）
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT id FROM jobs WHERE app = ? AND key = ? AND stage IN ({','.join('?' * len(UNFINISHED_STAGES))})",
+                (app, key) + UNFINISHED_STAGES).fetchone()
+            if row:
+                return row[0]
+            cur = self._db.execute(
+                "INSERT INTO jobs (app, key, args, stage, updated) VALUES (?, ?, ?, ?, ?)",
+                (app, key, json.dumps(args, ensure_ascii=False), STAGE_QUEUED, time.time()))
+            self._db.commit()
+            return cur.lastrowid
+
+    def is_live(self, entry_id):
+        # 同一个链接 + 格式 add() 会返回同一条记录；已有没结束的任务在做它时不要再提交第二个，
+        # 否则两个任务会写同一个输出文件和 .part
+        job = self._live.get(entry_id)
+        return job is not None and job.state not in FINISHED_STATES
+
+    def bind(self, entry_id, job):
+        self._live[entry_id] = job
+
+    def get(self, entry_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, app, key, args, stage, final_path, tmp_path FROM jobs WHERE id = ?",
+                (entry_id,)).fetchone()
+        return _entry(row) if row else None
+
+    def update(self, entry_id, stage, final_path=None, tmp_path=None, error=None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET stage = ?, final_path = COALESCE(?, final_path), "
+                "tmp_path = COALESCE(?, tmp_path), error = ?, updated = ? WHERE id = ?",
+                (stage, final_path, tmp_path, error, time.time(), entry_id))
+            self._db.commit()
+
+    def remove(self, entry_id):
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (entry_id,))
+            self._db.commit()
+
+    def purge_failed(self, max_age=FAILED_RETENTION):
+        # 失败的记录不会再被 pending() 排回队列，只留一段时间，日志不会越积越大
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE stage = ? AND updated < ?", (STAGE_FAILED, time.time() - max_age))
+            self._db.commit()
+
+    def watch(self, job_queue):
+        # 任务结束时同步日志：完成/取消的删掉，失败的标记失败；
+        # 转码阶段失败的退回“已下载”，下次只重做转码。任务需带 journal_id 属性
+        job_queue.add_listener(self._on_job_update)
+
+    def _on_job_update(self, job):
+        entry_id = getattr(job, "journal_id", None)
+        if entry_id is None or job.state not in (DONE, FAILED, CANCELLED):
+            return
+        if self._live.get(entry_id) is job:
+            self._live.pop(entry_id, None)
+        if job.state != FAILED:
+            self.remove(entry_id)
+            return
+        entry = self.get(entry_id)
+        if entry and entry["stage"] == STAGE_TRANSCODING:
+            self.update(entry_id, STAGE_DOWNLOADED, error=str(job.error))
+        elif entry:
+            self.update(entry_id, STAGE_FAILED, error=str(job.error))
+
+    def pending(self, app):
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, app, key, args, stage, final_path, tmp_path FROM jobs "
+                f"WHERE app = ? AND stage IN ({','.join('?' * len(UNFINISHED_STAGES))}) ORDER BY id",
+                (app,) + UNFINISHED_STAGES).fetchall()
+        return [_entry(row) for row in rows]
+
+    def harvest_position(self, app, url):
+        with self._lock:
+            row = self._db.execute("SELECT position FROM harvests WHERE app = ? AND url = ?", (app, url)).fetchone()
+        return row[0] if row else 0
+
+    def save_harvest(self, app, url, position):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO harvests VALUES (?, ?, ?, ?)", (app, url, position, time.time()))
+            self._db.commit()
+
+    def finish_harvest(self, app, url):
+        # 采集完整走完后清掉位置，下次再采集同一个主页从头开始（新发的内容在最前面）
+        with self._lock:
+            self._db.execute("DELETE FROM harvests WHERE app = ? AND url = ?", (app, url))
+            self._db.commit()
+
+
+def _entry(row):
+    return {"id": row[0], "app": row[1], "key": row[2], "args": json.loads(row[3]),
+            "stage": row[4], "final_path": row[5], "tmp_path": row[6]}
@@ -0,0 +1,243 @@
+﻿import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+# --------------------
+# 任务状态
+# --------------------
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+MERGING = "merging"
+TRANSCODING = "transcoding"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+STATE_TEXT = {
+    QUEUED: "⏳ 排队中",
+    DOWNLOADING: "⬇️ 下载中",
+    MERGING: "🔗 合并中",
+    TRANSCODING: "🎞️ 转码中",
+    DONE: "✅ 完成",
+    FAILED: "❌ 失败",
+    CANCELLED: "⛔ 已取消",
+}
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+DEFAULT_MAX_WORKERS = 3
+MIN_WEIGHT = 0.25         # 限速时分带宽的权重范围
+MAX_WEIGHT = 8.0
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, func, args, name, on_update):
+        self.id = next(Job._ids)
+        self.name = name
+        self.func = func
+        self.args = args
+        self.state = QUEUED
+        self.progress = 0.0
+        self.downloaded_bytes = 0
+        self.total_bytes = 0
+        self.speed = 0.0          # 字节/秒，只在下载中有意义
+        self.message = ""
+        self.error = None
+        self.priority = False     # 优先任务：排队时插到最前，限速时先分带宽
+        self.weight = 1.0         # 限速时按权重公平分带宽
+        self._on_update = on_update
+        self._cancel_event = threading.Event()
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+
+    @property
+    def paused(self):
+        return not self._resume_event.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def update(self, state=None, progress=None, message=None, downloaded_bytes=None, total_bytes=None, speed=None):
+        if state is not None:
+            self.state = state
+            if state != DOWNLOADING:
+                self.speed = 0.0
+        if progress is not None:
+            self.progress = progress
+        if message is not None:
+            self.message = message
+        if downloaded_bytes is not None:
+            self.downloaded_bytes = downloaded_bytes
+        if total_bytes is not None:
+            self.total_bytes = total_bytes
+        if speed is not None:
+            self.speed = speed
+        if self._on_update:
+            self._on_update(self)
+
+    def pause(self):
+        if self.state not in FINISHED_STATES:
+            self._resume_event.clear()
+            self.update()
+
+    def resume(self):
+        self._resume_event.set()
+        self.update()
+
+    def cancel(self):
+        self._cancel_event.set()
+        self._resume_event.set()
+        self.update()
+
+    def sleep(self, seconds):
+        # 可被取消打断的等待（重试退避、站点熔断时用）
+        if self._cancel_event.wait(seconds):
+            raise JobCancelled()
+
+    def checkpoint(self):
+        # 在 yt-dlp 回调中调用：暂停时阻塞当前下载线程，取消时抛异常中断下载
+        self._resume_event.wait()
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+
+# --------------------
+# 有界并发任务队列
+# --------------------
+class JobQueue:
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max(1, int(max_workers))
+        self.jobs = []
+        self._listeners = []
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._all_done = threading.Condition(self._lock)
+        self._running = 0
+
+    def submit(self, func, *args, name=""):
+        # func(job, *args)：正常返回即完成，抛 JobCancelled 视为取消，其他异常视为失败；
+        # 返回 Future 表示后续阶段（如转码）交给别的线程池，下载槽位先释放，Future 结束时任务才结束
+        job = Job(func, args, name, self._notify)
+        with self._lock:
+            self.jobs.append(job)
+            self._pending.append(job)
+        job.update()
+        self._spawn_workers()
+        return job
+
+    def add_listener(self, callback):
+        # callback(job) 在任务所在线程中调用，界面更新需自行切回主线程
+        self._listeners.append(callback)
+
+    def _notify(self, job):
+        for callback in self._listeners:
+            try:
+                callback(job)
+            except Exception:
+                pass
+
+    def set_max_workers(self, n):
+        with self._lock:
+            self.max_workers = max(1, int(n))
+        self._spawn_workers()
+
+    def prioritize(self, job):
+        # “下一个就下它”：还在排队的挪到队首
+        job.priority = True
+        with self._lock:
+            if job in self._pending:
+                self._pending.remove(job)
+                self._pending.appendleft(job)
+        job.update()
+
+    def set_weight(self, job, weight):
+        # 限速时按权重分带宽：权重 2 的任务分到的带宽是权重 1 的两倍
+        job.weight = min(MAX_WEIGHT, max(MIN_WEIGHT, weight))
+        job.update()
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            if job.state not in FINISHED_STATES:
+                job.cancel()
+
+    def join(self, timeout=None):
+        # 等待目前所有任务结束（包括交给转码池的后续阶段），超时返回 False
+        with self._all_done:
+            return self._all_done.wait_for(
+                lambda: all(job.state in FINISHED_STATES for job in self.jobs), timeout)
+
+    def wait_for_room(self, limit, timeout=None):
+        # 提交方限流：未结束的任务（排队、下载、转码中）少于 limit 个才返回，边枚举边提交时队列不会无限变长
+        with self._all_done:
+            return self._all_done.wait_for(
+                lambda: sum(1 for job in self.jobs if job.state not in FINISHED_STATES) < limit, timeout)
+
+    def prune(self, jobs=None):
+        # 把已结束的任务移出列表并返回，长时间运行时列表只保留未结束的；jobs 给定时只移这几个（界面逐个清理用）
+        with self._lock:
+            finished = [job for job in self.jobs if job.state in FINISHED_STATES and (jobs is None or job in jobs)]
+            self.jobs = [job for job in self.jobs if job not in finished]
+        return finished
+
+    def counts(self):
+        result = {}
+        with self._lock:
+            for job in self.jobs:
+                result[job.state] = result.get(job.state, 0) + 1
+        return result
+
+    def _spawn_workers(self):
+        with self._lock:
+            to_start = min(self.max_workers - self._running, len(self._pending))
+            self._running += max(0, to_start)
+        for _ in range(to_start):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def _next_job(self):
+        with self._lock:
+            # 并发上限被调小时，多余的工作线程在取下一个任务前退出
+            if self._running > self.max_workers or not self._pending:
+                self._running -= 1
+                return None
+            return self._pending.popleft()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._run(job)
+
+    def _run(self, job):
+        if job.cancelled:
+            self._finish(job, JobCancelled())
+            return
+        try:
+            job.checkpoint()
+            result = job.func(job, *job.args)
+        except Exception as e:
+            self._finish(job, e)
+            return
+        if isinstance(result, Future):
+            result.add_done_callback(lambda f: self._finish(job, f.exception()))
+        else:
+            self._finish(job, None)
+
+    def _finish(self, job, error):
+        if error is None:
+            job.update(state=DONE, progress=100)
+        elif isinstance(error, JobCancelled):
+            job.update(state=CANCELLED)
+        else:
+            job.error = error
+            job.update(state=FAILED, message=str(error))
+        with self._all_done:
+            self._all_done.notify_all()
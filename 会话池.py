@@ -0,0 +1,185 @@
+﻿import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+from 解析缓存 import normalize_url
+
+logger = logging.getLogger(__name__)
+
+MAX_IDLE_PER_SITE = 4     # 每个站点最多留几个空闲实例
+IDLE_TIMEOUT = 300        # 秒，空闲超过这么久就关掉
+MAX_AGE = 1800            # 秒，实例最长使用时间，到期换新的（连接、令牌都重建）
+MAX_FAILURES = 3          # 连续出错这么多次视为不健康，直接丢弃
+GUEST_TOKEN_TTL = 600     # 秒，推特游客令牌在同一站点的实例间复用多久
+
+# 小红书图文笔记没有视频格式，图片只在 thumbnails 里，不能当成解析失败
+BASE_OPTS = {"quiet": True, "no_warnings": True, "ignore_no_formats_error": True}
+
+# 预热时按解析器名找到对应站点
+SITE_URLS = {
+    "Twitter": "https://twitter.com/",
+    "XiaoHongShu": "https://www.xiaohongshu.com/",
+}
+
+
+def site_of(url):
+    return normalize_url(url).split("/", 1)[0]
+
+
+class _Session:
+    def __init__(self, site, ydl):
+        self.site = site
+        self.ydl = ydl
+        self.created = time.time()
+        self.last_used = self.created
+        self.failures = 0
+        self.uses = 0
+
+    def healthy(self, now):
+        return (self.failures < MAX_FAILURES and now - self.created < MAX_AGE
+                and now - self.last_used < IDLE_TIMEOUT)
+
+
+# --------------------
+# YoutubeDL 会话池：按站点保留解析用的 YoutubeDL 实例，连接、cookie、已初始化的解析器都不用每次重建。
+# 一个实例同一时间只借给一个线程；同站点的实例共用一个 cookie jar，推特游客令牌也在它们之间复用
+# --------------------
+class SessionPool:
+    def __init__(self, max_idle=MAX_IDLE_PER_SITE):
+        self.max_idle = max_idle
+        self._idle = {}            # 站点 -> [_Session]，最近用过的在最后
+        self._jars = {}            # 站点 -> cookie jar
+        self._tokens = {}          # 站点 -> (游客令牌, 过期时间)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def _new(self, site):
+        import yt_dlp
+        ydl = yt_dlp.YoutubeDL(dict(BASE_OPTS))
+        self.attach(ydl, site=site)
+        with self._lock:
+            self.created += 1
+        return _Session(site, ydl)
+
+    def attach(self, ydl, url=None, site=None):
+        # 让别处临时建的 YoutubeDL（比如带进度回调的下载）也用这个站点的 cookie；
+        # cookiejar 是 cached_property，必须在第一次发请求之前替换
+        site = site or site_of(url)
+        with self._lock:
+            jar = self._jars.get(site)
+            if jar is None:
+                jar = self._jars[site] = ydl.cookiejar
+        ydl.__dict__["cookiejar"] = jar
+        return ydl
+
+    def acquire(self, url):
+        site = site_of(url)
+        now = time.time()
+        stale = []
+        session = None
+        with self._lock:
+            idle = self._idle.get(site, [])
+            while idle:
+                candidate = idle.pop()
+                if candidate.healthy(now):
+                    session = candidate
+                    break
+                stale.append(candidate)
+            if session is not None:
+                self.reused += 1
+        self._close(stale)
+        return session or self._new(site)
+
+    def release(self, session, ok=True):
+        session.last_used = time.time()
+        session.uses += 1
+        session.failures = 0 if ok else session.failures + 1
+        if not ok:
+            # 出错可能是令牌被限流，下次重新领
+            with self._lock:
+                self._tokens.pop(session.site, None)
+        self._share_guest_token(session)
+        extra = []
+        with self._lock:
+            idle = self._idle.setdefault(session.site, [])
+            if session.healthy(session.last_used):
+                idle.append(session)
+            else:
+                extra.append(session)
+            while len(idle) > self.max_idle:
+                extra.append(idle.pop(0))
+        self._close(extra + self.evict_idle(close=False))
+
+    @contextmanager
+    def session(self, url):
+        # with sessions.session(url) as ydl: ydl.extract_info(url, download=False)
+        session = self.acquire(url)
+        try:
+            yield session.ydl
+        except Exception:
+            self.release(session, ok=False)
+            raise
+        self.release(session)
+
+    def prewarm(self, url, ie_key=None):
+        # 启动时先建好一个实例，顺便把站点解析器实例化
+        with self.session(url) as ydl:
+            if ie_key:
+                ydl.get_info_extractor(ie_key)
+
+    def _share_guest_token(self, session):
+        # yt-dlp 的推特解析器每次调用接口都重新领游客令牌；包一层，令牌在同站点实例间复用
+        for ie in list(session.ydl._ies_instances.values()):
+            fetch = getattr(ie, "_fetch_guest_token", None)
+            if fetch is None or getattr(fetch, "pooled", False):
+                continue
+            ie._fetch_guest_token = self._cached_token(session.site, fetch)
+
+    def _cached_token(self, site, fetch):
+        def cached(display_id):
+            with self._lock:
+                token, expires = self._tokens.get(site, (None, 0))
+            if token and time.time() < expires:
+                return token
+            token = fetch(display_id)
+            with self._lock:
+                self._tokens[site] = (token, time.time() + GUEST_TOKEN_TTL)
+            return token
+        cached.pooled = True
+        return cached
+
+    def evict_idle(self, close=True):
+        now = time.time()
+        stale = []
+        with self._lock:
+            for site, idle in self._idle.items():
+                stale += [s for s in idle if not s.healthy(now)]
+                idle[:] = [s for s in idle if s.healthy(now)]
+        if close:
+            self._close(stale)
+        return stale
+
+    def _close(self, sessions):
+        for session in sessions:
+            try:
+                session.ydl.close()
+            except Exception as e:
+                logger.debug("关闭 YoutubeDL 实例出错: %s", e)
+
+    def close(self):
+        with self._lock:
+            sessions = [s for idle in self._idle.values() for s in idle]
+            self._idle.clear()
+        self._close(sessions)
+
+    def stats(self):
+        with self._lock:
+            return {"created": self.created, "reused": self.reused,
+                    "idle": {site: len(idle) for site, idle in self._idle.items() if idle}}
+
+
+sessions = SessionPool()
+atexit.register(sessions.close)
@@ -0,0 +1,164 @@
+﻿import re
+import time
+import logging
+import threading
+
+from 解析缓存 import normalize_url
+
+logger = logging.getLogger(__name__)
+
+MIN_FRAGMENTS = 1        # 分片并发下限
+MAX_FRAGMENTS = 16       # 分片并发上限
+START_FRAGMENTS = 2      # 新站点从小并发开始试
+RAMP_GAIN = 1.1          # 吞吐提升超过 10% 才继续加并发
+BACKOFF_BASE = 1.0       # 分片 429/5xx 重试的退避：1s、2s、4s ... 最多 30s
+BACKOFF_MAX = 30.0
+FRAGMENT_RETRIES = 10    # yt-dlp 作为库调用时分片默认不重试，出错直接跳过该分片
+
+_HTTP_ERROR = re.compile(r"HTTP Error (\d{3})")
+
+
+def is_throttle_status(status):
+    return status == 429 or 500 <= status < 600
+
+
+def fragment_backoff(n):
+    # yt-dlp 的 retry_sleep_functions：第 n 次重试前等待的秒数
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** n)
+
+
+# --------------------
+# 分片并发自适应：每个站点记住合适的并发数。yt-dlp 的分片线程池在一次下载里是固定的，
+# 所以按“一次下载”为单位调整：吞吐还在涨就翻倍，遇到 429/5xx 减半并压低上限，之后慢慢放开
+# --------------------
+class FragmentTuner:
+    def __init__(self, start=START_FRAGMENTS):
+        self.start = start
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _state(self, host):
+        if host not in self._hosts:
+            self._hosts[host] = {"n": self.start, "limit": MAX_FRAGMENTS, "best": 0.0, "best_n": self.start}
+        return self._hosts[host]
+
+    def concurrency(self, url):
+        with self._lock:
+            return self._state(_host(url))["n"]
+
+    def report(self, url, stats):
+        # 一次分片下载结束后调用；分片数太少（小于并发的两倍）的样本不足以判断吞吐，只看错误
+        host = _host(url)
+        with self._lock:
+            st = self._state(host)
+            n = stats.concurrency
+            if stats.throttled:
+                st["n"] = st["limit"] = max(MIN_FRAGMENTS, n // 2)
+                st["best"] = 0.0
+            elif stats.count >= n * 2:
+                throughput = stats.throughput
+                if throughput > st["best"] * RAMP_GAIN:
+                    st["best"], st["best_n"] = throughput, n
+                    st["n"] = min(st["limit"], n * 2)
+                elif throughput * RAMP_GAIN < st["best"]:
+                    # 比之前最好的一次还慢：退回当时的并发
+                    st["n"] = st["best_n"]
+                # 没出错的下载慢慢放开上限
+                st["limit"] = min(MAX_FRAGMENTS, st["limit"] + 1)
+            logger.info("%s 分片并发 %d -> %d (%s)", host, n, st["n"], stats.summary())
+            return st["n"]
+
+
+def _host(url):
+    return normalize_url(url).split("/", 1)[0]
+
+
+# --------------------
+# 单次下载的分片统计：每个分片耗时、吞吐和 429/5xx 次数
+# --------------------
+class FragmentStats:
+    def __init__(self, concurrency=START_FRAGMENTS):
+        self.concurrency = concurrency
+        self.durations = []
+        self.errors = {}
+        self.bytes = 0
+        self.elapsed = 0.0
+        self._started = time.monotonic()
+        self._thread_started = {}
+        self._last_index = 0
+        self._lock = threading.Lock()
+
+    @property
+    def count(self):
+        return len(self.durations)
+
+    @property
+    def throttled(self):
+        return any(is_throttle_status(status) for status in self.errors)
+
+    @property
+    def throughput(self):
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+    def on_progress(self, d):
+        # 在 yt-dlp 的分片线程里调用。fragment_index 在某个分片下完时加一，
+        # 同一线程上一个分片结束（或下载开始）到这次结束之间就是这个分片的耗时（含建连和等待）
+        now = time.monotonic()
+        with self._lock:
+            if d.get("status") == "finished":
+                # 视频+音频分两路下载时累加，下一路的分片序号从头开始
+                self.bytes += d.get("total_bytes") or d.get("downloaded_bytes") or 0
+                self.elapsed += d.get("elapsed") or (now - self._started)
+                self._started = now
+                self._last_index = 0
+                self._thread_started.clear()
+                return
+            index = d.get("fragment_index")
+            if index is not None and index > self._last_index:
+                self._last_index = index
+                tid = threading.get_ident()
+                self.durations.append(now - self._thread_started.get(tid, self._started))
+                self._thread_started[tid] = now
+
+    def on_error(self, status):
+        with self._lock:
+            self.errors[status] = self.errors.get(status, 0) + 1
+
+    def summary(self):
+        with self._lock:
+            durations = sorted(self.durations)
+            errors = dict(self.errors)
+        result = {"fragments": len(durations), "concurrency": self.concurrency,
+                  "throughput": round(self.throughput), "errors": errors}
+        if durations:
+            result.update(
+                mean=round(sum(durations) / len(durations), 3),
+                p50=round(durations[len(durations) // 2], 3),
+                p90=round(durations[min(len(durations) - 1, int(len(durations) * 0.9))], 3),
+                max=round(durations[-1], 3))
+        return result
+
+
+# --------------------
+# 给 yt-dlp 的 logger：重试提示里带 HTTP 状态码，从这里统计 429/5xx
+# --------------------
+class FragmentLogger:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def debug(self, msg):
+        if "Got error" in msg:
+            m = _HTTP_ERROR.search(msg)
+            if m:
+                self.stats.on_error(int(m.group(1)))
+
+    def info(self, msg):
+        pass
+
+    warning = debug
+
+    def error(self, msg):
+        pass
+
+
+fragment_tuner = FragmentTuner()
@@ -0,0 +1,113 @@
+﻿import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from 解析缓存 import extract_info, extract_cache, cache_keys, is_pending
+
+POLL_MS = 800            # 剪贴板轮询间隔
+PREFETCH_WORKERS = 2     # 后台预解析并发数
+SEEN_LIMIT = 256         # 记住最近多少个已预解析的链接
+
+# 推特 / X 的推文链接，小红书笔记链接和 xhslink 短链
+URL_PATTERN = re.compile(
+    r"https?://(?:(?:www\.|mobile\.)?(?:twitter|x)\.com/[^\s/]+/status/\d+"
+    r"|(?:www\.)?xiaohongshu\.com/(?:explore|discovery/item)/[0-9a-fA-F]+"
+    r"|xhslink\.com/[A-Za-z0-9/_-]+)[A-Za-z0-9._~/?#@!$&'*+=%:-]*")
+
+
+def find_urls(text):
+    return URL_PATTERN.findall(text or "")
+
+
+def unique_urls(urls):
+    # 按推文 / 笔记 id 去重（x.com 与 twitter.com、带不带参数都算同一个），保持原顺序
+    seen = set()
+    result = []
+    for url in urls:
+        key = cache_keys(url)[0]
+        if key not in seen:
+            seen.add(key)
+            result.append(url)
+    return result
+
+
+def paste_urls():
+    # 从剪贴板取出所有推特 / 小红书链接；一个都认不出时，整段文本是单个链接也照旧交给 yt-dlp
+    import pyperclip
+    try:
+        text = pyperclip.paste().strip()
+    except Exception:
+        text = ""
+    urls = unique_urls(find_urls(text))
+    if not urls and text.startswith("http") and len(text.split()) == 1:
+        urls = [text]
+    return urls
+
+
+# --------------------
+# 后台预解析：结果进解析缓存，用户点“粘贴并解析”时直接命中
+# --------------------
+class Prefetcher:
+    def __init__(self, max_workers=PREFETCH_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._seen = deque(maxlen=SEEN_LIMIT)
+        self._lock = threading.Lock()
+
+    def prefetch(self, url):
+        # 已缓存、正在解析或最近预解析过的链接直接跳过；返回是否真的提交了
+        key = cache_keys(url)[0]
+        with self._lock:
+            if key in self._seen or is_pending(url) or extract_cache.get(url) is not None:
+                return False
+            self._seen.append(key)
+        self._executor.submit(self._run, url, key)
+        return True
+
+    def _run(self, url, key):
+        try:
+            extract_info(url)
+        except Exception:
+            # 失败的允许下次再试
+            with self._lock:
+                if key in self._seen:
+                    self._seen.remove(key)
+
+
+# --------------------
+# 剪贴板监听（在 Tk 主线程里定时读取）
+# --------------------
+class ClipboardWatcher:
+    def __init__(self, root, prefetcher=None, on_found=None, interval_ms=POLL_MS):
+        self.root = root
+        self.prefetcher = prefetcher or Prefetcher()
+        self.on_found = on_found
+        self.interval_ms = interval_ms
+        self.enabled = False
+        self._last_text = None
+        self._after_id = None
+
+    def set_enabled(self, enabled):
+        # 关掉时取消已排好的下一次轮询，否则很快再打开会多出一个轮询循环
+        self.enabled = enabled
+        if not enabled and self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        elif enabled and self._after_id is None:
+            self._poll()
+
+    def _poll(self):
+        self._after_id = None
+        if not self.enabled:
+            return
+        import pyperclip
+        try:
+            text = pyperclip.paste()
+        except Exception:
+            text = None
+        if text and text != self._last_text:
+            self._last_text = text
+            urls = [url for url in find_urls(text) if self.prefetcher.prefetch(url)]
+            if urls and self.on_found:
+                self.on_found(urls)
+        self._after_id = self.root.after(self.interval_ms, self._poll)
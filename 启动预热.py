@@ -0,0 +1,58 @@
+﻿import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+STARTUP_LOG = "startup.jsonl"
+WARM_SITES = ("Twitter", "XiaoHongShu")
+
+
+# --------------------
+# 后台预热：窗口先画出来，yt-dlp 等重模块在后台线程里导入，
+# 顺便给每个站点在会话池里建好一个 YoutubeDL，并把解析器实例化（yt-dlp 的解析器是懒加载的，第一次用到才导入对应模块）
+# --------------------
+def warm_up(sites=WARM_SITES):
+    timings = {}
+    done = threading.Event()
+
+    def run():
+        started = time.perf_counter()
+        try:
+            import yt_dlp
+            timings["yt_dlp"] = round(time.perf_counter() - started, 3)
+            from 会话池 import sessions, SITE_URLS
+            for site in sites:
+                sessions.prewarm(SITE_URLS[site], site)
+            import humanize, pyperclip  # 界面刷新和粘贴时要用，顺带导入
+        except Exception as e:
+            logger.warning("预热失败: %s", e)
+        timings["warm_up"] = round(time.perf_counter() - started, 3)
+        done.set()
+
+    threading.Thread(target=run, daemon=True, name="warm-up").start()
+    return timings, done
+
+
+# --------------------
+# 启动耗时：从脚本开始执行到 Tk 主循环第一次空闲（窗口已画出、可以操作）
+# --------------------
+def track_startup(root, app, started, warm=None):
+    def record(entry):
+        if warm is not None:
+            timings, done = warm
+            # 预热还没完时等它结束再一起记
+            if not done.is_set():
+                root.after(200, record, entry)
+                return
+            entry.update(timings)
+        logger.info("启动耗时: %s", entry)
+        try:
+            with open(STARTUP_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError:
+            pass
+
+    root.after_idle(lambda: record(
+        {"app": app, "time": round(time.time()), "interactive": round(time.perf_counter() - started, 3)}))
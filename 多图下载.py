@@ -0,0 +1,177 @@
+﻿import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from 会话池 import sessions
+from 带宽调度 import bandwidth
+from 任务队列 import DOWNLOADING
+from 重试熔断 import resilience
+
+GALLERY = "gallery"        # 图文笔记“下载全部”在任务日志 / 存档里用的格式名
+ASSET_WORKERS = 6          # 所有笔记合计同时下载的文件数
+CHUNK_SIZE = 256 * 1024
+REFERER = "https://www.xiaohongshu.com/"
+
+_EXTENSIONS = {
+    "image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/gif": "gif",
+    "image/heic": "heic", "image/avif": "avif", "video/mp4": "mp4",
+}
+
+
+def _image_key(url):
+    # 同一张图的默认图和预览图只是 ! 后面的处理参数不同
+    return url.split("?")[0].rsplit("/", 1)[-1].split("!")[0]
+
+
+def note_assets(info):
+    # 笔记里的所有图片（按笔记顺序）和视频（取最好的一个格式），每项 {"name", "kind", "url", "headers", "ext"}
+    assets = []
+    seen = set()
+    # yt-dlp 处理结果时把 thumbnails 按清晰度排过序，按解析时记下的原位置排回笔记里的顺序
+    thumbs = sorted(info.get("thumbnails") or [], key=lambda t: t.get("original_index", 0))
+    for thumb in thumbs:
+        url = thumb.get("url")
+        if not url or _image_key(url) in seen:
+            continue
+        seen.add(_image_key(url))
+        assets.append({"name": f"{len(assets) + 1:02d}", "kind": "image", "url": url,
+                       "headers": {"Referer": REFERER}, "ext": None})
+    formats = [f for f in info.get("formats") or [] if f.get("url") and f.get("vcodec") != "none"]
+    if formats:
+        # yt-dlp 的格式按从差到好排序
+        best = formats[-1]
+        assets.append({"name": "video", "kind": "video", "url": best["url"],
+                       "headers": dict(best.get("http_headers") or {"Referer": REFERER}),
+                       "ext": best.get("ext") or "mp4"})
+    return assets
+
+
+def asset_summary(assets):
+    images = sum(1 for a in assets if a["kind"] == "image")
+    videos = len(assets) - images
+    parts = [f"{images} 张图片"] if images else []
+    if videos:
+        parts.append(f"{videos} 个视频")
+    return "、".join(parts)
+
+
+def _extension(content_type, default="jpg"):
+    return _EXTENSIONS.get((content_type or "").split(";")[0].strip().lower(), default)
+
+
+def _existing(folder, name):
+    # 上次已经下完的文件（按名字前缀找，扩展名下载时才知道）
+    for entry in os.listdir(folder):
+        if entry.startswith(name + ".") and not entry.endswith(".part"):
+            return os.path.join(folder, entry)
+    return None
+
+
+class _NoteProgress:
+    # 一篇笔记内所有文件的合计进度：百分比按文件平均，字节数和速度按合计
+    def __init__(self, job, count):
+        self.job = job
+        self.count = count
+        self.started = time.time()
+        self._received = {}
+        self._sizes = {}
+        self._finished = set()
+        self._lock = threading.Lock()
+
+    def begin(self, name, size):
+        # 重试时从头再下，已收的字节清零
+        with self._lock:
+            self._sizes[name] = size
+            self._received[name] = 0
+
+    def add(self, name, nbytes):
+        with self._lock:
+            self._received[name] = self._received.get(name, 0) + nbytes
+        self._report()
+
+    def finish(self, name, size=None):
+        with self._lock:
+            self._finished.add(name)
+            if size is not None:
+                self._received[name] = self._sizes[name] = size
+        self._report()
+
+    def _report(self):
+        with self._lock:
+            fractions = 0.0
+            for name in set(self._sizes) | self._finished:
+                if name in self._finished:
+                    fractions += 1
+                elif self._sizes.get(name):
+                    fractions += min(1.0, self._received.get(name, 0) / self._sizes[name])
+            received = sum(self._received.values())
+            total = sum(self._sizes.values())
+            elapsed = max(time.time() - self.started, 1e-6)
+        self.job.update(progress=fractions * 100.0 / self.count, downloaded_bytes=received,
+                        total_bytes=total, speed=received / elapsed,
+                        message=f"{len(self._finished)}/{self.count}")
+
+    @property
+    def received(self):
+        with self._lock:
+            return sum(self._received.values())
+
+
+# --------------------
+# 多文件并发下载：一篇笔记的图片和视频同时下，连接走会话池复用，受全局限速；
+# 先写 .part 再改名，中断后重下时已完成的文件直接跳过
+# --------------------
+class AssetFetcher:
+    def __init__(self, max_workers=ASSET_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="asset")
+
+    def fetch(self, job, assets, folder):
+        # 在任务线程里调用，返回 ([(asset, 路径)], 文件合计字节数)；有文件失败时其余照常下完，最后抛出第一个错误
+        os.makedirs(folder, exist_ok=True)
+        progress = _NoteProgress(job, len(assets))
+        job.update(state=DOWNLOADING, progress=0)
+        futures = [self._executor.submit(resilience.call, asset["url"], self._fetch_one, job, asset, folder, progress,
+                                         job=job) for asset in assets]
+        try:
+            wait(futures)
+        finally:
+            bandwidth.forget(job)
+        results = []
+        for asset, future in zip(assets, futures):
+            results.append((asset, future.result()))
+        job.update(progress=100, speed=0.0)
+        return results, progress.received
+
+    def _fetch_one(self, job, asset, folder, progress):
+        from yt_dlp.networking import Request
+        job.checkpoint()
+        name = asset["name"]
+        existing = _existing(folder, name)
+        if existing:
+            progress.finish(name, os.path.getsize(existing))
+            return existing
+        tmp = os.path.join(folder, name + ".part")
+        with sessions.session(asset["url"]) as ydl:
+            response = ydl.urlopen(Request(asset["url"], headers=asset["headers"]))
+            try:
+                ext = asset["ext"] or _extension(response.headers.get("Content-Type"))
+                progress.begin(name, int(response.headers.get("Content-Length") or 0))
+                with open(tmp, "wb") as f:
+                    while True:
+                        job.checkpoint()
+                        chunk = response.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        bandwidth.consume(job, len(chunk))
+                        progress.add(name, len(chunk))
+            finally:
+                response.close()
+        path = os.path.join(folder, f"{name}.{ext}")
+        os.replace(tmp, path)
+        progress.finish(name)
+        return path
+
+
+asset_fetcher = AssetFetcher()
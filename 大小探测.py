@@ -0,0 +1,196 @@
+﻿import re
+import logging
+import threading
+from urllib.parse import urljoin
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from 会话池 import sessions, site_of
+
+logger = logging.getLogger(__name__)
+
+PROBE_WORKERS = 8        # 同时探测的请求数
+PER_HOST_LIMIT = 4       # 同一个 CDN 主机最多同时几个探测请求
+CACHE_SIZE = 512         # 按媒体链接缓存探测结果
+PROBE_TIMEOUT = 10       # 秒
+SAMPLE_FRAGMENTS = 3     # HLS 没有码率信息时，抽几个分片看大小再按时长推算
+
+_BYTERANGE = re.compile(r"#EXT-X-BYTERANGE:(\d+)")
+_CONTENT_RANGE = re.compile(r"/(\d+)\s*$")
+
+
+def _is_progressive(fmt):
+    return (fmt.get("protocol") or "https").split("+")[0] in ("http", "https")
+
+
+def _is_hls(fmt):
+    return (fmt.get("protocol") or "").startswith("m3u8")
+
+
+def estimate_size(fmt, duration):
+    # 码率 × 时长：tbr 单位是 kbit/s
+    if fmt.get("tbr") and duration:
+        return int(fmt["tbr"] * 1000 / 8 * duration)
+    return None
+
+
+def _parse_playlist(text):
+    # 分片列表里的 (时长, 分片地址)
+    fragments = []
+    seconds = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXTINF:"):
+            try:
+                seconds = float(line[len("#EXTINF:"):].split(",")[0])
+            except ValueError:
+                seconds = 0.0
+        elif line and not line.startswith("#") and seconds is not None:
+            fragments.append((seconds, line))
+            seconds = None
+    return fragments
+
+
+# --------------------
+# 格式大小探测：yt-dlp 没给出大小的格式，后台并发去问 CDN。
+# 直链发 HEAD（不支持时用 Range: bytes=0-0 看 Content-Range）；HLS 读分片列表，有 BYTERANGE 就把
+# 分片大小加起来，没有就按码率 × 时长估算，连码率也没有时抽几个分片按时长推算。请求走会话池，连接和 cookie 复用
+# --------------------
+class SizeProber:
+    def __init__(self, max_workers=PROBE_WORKERS, per_host=PER_HOST_LIMIT):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="size-probe")
+        self.per_host = per_host
+        self._hosts = {}
+        self._cache = OrderedDict()    # 媒体链接 -> (字节数, 是否估算)
+        self._lock = threading.Lock()
+
+    def cached(self, url):
+        with self._lock:
+            if url in self._cache:
+                self._cache.move_to_end(url)
+                return self._cache[url]
+        return None
+
+    def _remember(self, url, result):
+        with self._lock:
+            self._cache[url] = result
+            self._cache.move_to_end(url)
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def _host_slot(self, url):
+        host = site_of(url)
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return self._hosts[host]
+
+    def probe(self, fmt, duration=None):
+        # 阻塞探测一个格式，返回 (字节数, 是否估算)；探测不到返回 (None, False)
+        url = fmt.get("url")
+        if not url:
+            return None, False
+        result = self.cached(url)
+        if result is not None:
+            return result
+        try:
+            with self._host_slot(url):
+                if _is_progressive(fmt):
+                    size = self._content_length(fmt)
+                    result = (size, False) if size else (None, False)
+                elif _is_hls(fmt):
+                    result = self._playlist_size(fmt, duration)
+                else:
+                    result = (None, False)
+        except Exception as e:
+            logger.debug("探测大小失败 %s: %s", url, e)
+            result = (None, False)
+        if result[0] is None:
+            # 请求不到时退回按码率估算
+            estimate = estimate_size(fmt, duration)
+            if estimate:
+                result = (estimate, True)
+        self._remember(url, result)
+        return result
+
+    def _request(self, fmt, method="GET", headers=None):
+        from yt_dlp.networking import Request
+        all_headers = dict(fmt.get("http_headers") or {})
+        all_headers.update(headers or {})
+        with sessions.session(fmt["url"]) as ydl:
+            response = ydl.urlopen(Request(fmt["url"], headers=all_headers, method=method,
+                                           extensions={"timeout": PROBE_TIMEOUT}))
+            try:
+                return response.status, dict(response.headers), response.read() if method == "GET" else b""
+            finally:
+                response.close()
+
+    def _content_length(self, fmt):
+        # 直链大小：先 HEAD，不给 Content-Length 时再用 Range 请求
+        try:
+            _, headers, _ = self._request(fmt, method="HEAD")
+            length = headers.get("Content-Length") or headers.get("content-length")
+            if length and int(length) > 0:
+                return int(length)
+        except Exception as e:
+            logger.debug("HEAD 失败，改用 Range 请求: %s", e)
+        _, headers, _ = self._request(fmt, headers={"Range": "bytes=0-0"})
+        m = _CONTENT_RANGE.search(headers.get("Content-Range") or headers.get("content-range") or "")
+        return int(m.group(1)) if m else None
+
+    def _playlist_size(self, fmt, duration):
+        _, _, body = self._request(fmt)
+        text = body.decode("utf-8", "replace")
+        ranges = [int(n) for n in _BYTERANGE.findall(text)]
+        if ranges:
+            return sum(ranges), False
+        fragments = _parse_playlist(text)
+        seconds = sum(d for d, _ in fragments) or duration
+        estimate = estimate_size(fmt, seconds)
+        if estimate:
+            return estimate, True
+        if not fragments:
+            return None, False
+        step = max(1, len(fragments) // SAMPLE_FRAGMENTS)
+        sample = fragments[::step][:SAMPLE_FRAGMENTS]
+        sizes = [self._content_length(dict(fmt, url=urljoin(fmt["url"], uri))) for _, uri in sample]
+        if not all(sizes):
+            return None, False
+        if len(sample) == len(fragments):
+            return sum(sizes), False
+        sampled = sum(d for d, _ in sample)
+        return (int(sum(sizes) / sampled * seconds), True) if sampled else (None, False)
+
+    def fill(self, info, formats, on_size):
+        # formats 为 collect_formats 的结果；大小未知的逐个提交后台探测，
+        # 每探测到一个就回调 on_size(format_id, 字节数, 是否估算)（在探测线程里调用）
+        raw = {f.get("format_id"): f for f in info.get("formats") or []}
+        duration = info.get("duration")
+        futures = []
+        for f in formats:
+            if f["size_bytes"] or f["id"] not in raw:
+                continue
+
+            def run(fmt_id=f["id"], fmt=raw[f["id"]]):
+                size, approx = self.probe(fmt, duration)
+                if size:
+                    on_size(fmt_id, size, approx)
+                return size, approx
+            futures.append(self._executor.submit(run))
+        return futures
+
+    def resolve(self, info, formats):
+        # 命令行用：阻塞到探测结束，直接把大小写回 formats
+        sizes = {}
+
+        def on_size(fmt_id, size, approx):
+            sizes[fmt_id] = size
+        for future in self.fill(info, formats, on_size):
+            future.result()
+        for f in formats:
+            if f["id"] in sizes:
+                f["size_bytes"] = sizes[f["id"]]
+        return formats
+
+
+size_prober = SizeProber()
@@ -1,19 +1,25 @@
-﻿import os
-import re
-import threading
+﻿import time
+STARTED = time.perf_counter()  # 启动计时起点，放在其他导入之前
+
+import os
 import tkinter as tk
-from tkinter import filedialog, scrolledtext, ttk
-import pyperclip
-import yt_dlp
-import humanize
+from tkinter import filedialog, ttk
+from 解析缓存 import extract_info, ParseBatch
+from 下载核心 import sanitize_filename, collect_formats, best_per_resolution, format_string, format_size, download_video
+from 大小探测 import size_prober
+from 任务队列 import JobQueue, JobCancelled, DEFAULT_MAX_WORKERS
+from 任务列表 import JobListView, UiPump
+from 结果列表 import ResultListView
+from 剪贴板监听 import ClipboardWatcher, paste_urls
+from 下载存档 import DownloadArchive
+from 任务日志 import JobJournal, STAGE_DOWNLOADING
+from 启动预热 import warm_up, track_startup
+from 任务指标 import metrics, stage
+from 多图下载 import note_assets, asset_summary, asset_fetcher, GALLERY
 
 # --------------------
 # 工具函数
 # --------------------
-def sanitize_filename(name):
-    name = re.sub(r'[\\/:*?"<>|]', '', name)
-    return name.strip()
-
 def select_folder():
     folder = filedialog.askdirectory()
     if folder:
@@ -40,136 +46,202 @@ class XHSDownloaderApp:
         # 功能按钮：粘贴并解析
         tk.Button(root, text="📋 粘贴并解析", command=self.paste_and_parse, bg="#4caf50", fg="white").pack(pady=10)
 
+        # 剪贴板监听：复制链接后立即在后台预解析
+        self.watch_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(root, text="👀 监听剪贴板（复制即预解析）", variable=self.watch_var, command=self.toggle_watch).pack()
+        self.watcher = ClipboardWatcher(root, on_found=self.on_clipboard_urls)
+
         # 状态
         self.status_var = tk.StringVar(value="准备就绪")
         tk.Label(root, textvariable=self.status_var).pack()
         self.progress = ttk.Progressbar(root, orient="horizontal", length=350, mode="determinate")
         self.progress.pack(pady=5)
 
+        self.jobs = JobQueue(DEFAULT_MAX_WORKERS)
+        self.ui = UiPump(root)
+        self.batch = None
+        self.job_view = JobListView(root, root, self.jobs, pump=self.ui, progress=self.progress)
+        self.archive = DownloadArchive()
+        self.journal = JobJournal()
+        self.journal.watch(self.jobs)
+        metrics.watch(self.jobs)
+
         # 结果列表
-        tk.Label(root, text="解析结果 (点击下载)：").pack(anchor="w", padx=10)
-        self.result_box = scrolledtext.ScrolledText(root, width=50, height=15)
-        self.result_box.pack(padx=10, pady=5, fill="both", expand=True)
+        self.results = ResultListView(root, root, lambda args: self.start_download(*args), height=15)
+
+        self.resume_jobs()
+
+    # 上次退出（或崩溃）时没完成的任务重新排队，yt-dlp 会接着 .part 文件续传
+    def resume_jobs(self):
+        entries = self.journal.pending("xiaohongshu")
+        for entry in entries:
+            self.start_download(*entry["args"], entry_id=entry["id"])
+        if entries:
+            self.status_var.set(f"♻️ 已恢复 {len(entries)} 个未完成的任务")
 
-        self.downloading = False
+    def toggle_watch(self):
+        self.watcher.set_enabled(self.watch_var.get())
+
+    def on_clipboard_urls(self, urls):
+        self.status_var.set(f"🔎 剪贴板发现 {len(urls)} 个新链接，后台预解析中...")
+
+    # 工作线程里改状态栏：交给主线程统一刷新
+    def set_status(self, text):
+        self.ui.post("status", self.status_var.set, text)
 
     # 粘贴剪贴板并解析
+    # 可以一次粘贴多个笔记链接：并发解析，哪个先解析完先显示哪个
     def paste_and_parse(self):
-        try:
-            url = pyperclip.paste().strip()
-        except:
-            url = ""
-        if not url or "http" not in url:
+        urls = paste_urls()
+        if not urls:
             self.status_var.set("❌ 剪贴板没有有效链接")
             return
 
-        self.result_box.delete("1.0", tk.END)
-        self.status_var.set("⏳ 正在解析视频，请稍候...")
-        threading.Thread(target=self.analyze, args=(url,), daemon=True).start()
+        self.results.clear()
+        self.status_var.set("⏳ 正在解析视频，请稍候..." if len(urls) == 1
+                            else f"⏳ 正在解析 {len(urls)} 个链接，请稍候...")
+        if self.batch:
+            self.batch.cancel()
+        self.batch = ParseBatch(urls, self.on_parsed, extract=self.extract).start()
 
-    # 解析视频
-    def analyze(self, url):
-        try:
-            ydl_opts = {"quiet": True, "no_warnings": True}
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                title = info.get("title", "xhs_video")
-                video_id = info.get("id", "")
-                formats = info.get("formats", [])
-
-                valid_formats = []
-                for f in formats:
-                    if f.get("vcodec") != 'none' and f.get("ext") == "mp4":
-                        filesize = f.get("filesize") or f.get("filesize_approx") or 0
-                        valid_formats.append({
-                            "id": f["format_id"],
-                            "res": f.get("resolution") or f"{f.get('width')}x{f.get('height')}",
-                            "size_bytes": filesize,
-                            "size_str": humanize.naturalsize(filesize) if filesize > 0 else "未知大小",
-                            "tbr": f.get("tbr") or 0
-                        })
-
-                if not valid_formats:
-                    self.status_var.set("❌ 解析失败：未找到可用视频")
-                    return
-
-                # 去重同分辨率，选最高码率
-                unique_formats = {}
-                for f in valid_formats:
-                    h = f["res"]
-                    if h not in unique_formats or f["tbr"] > unique_formats[h]["tbr"]:
-                        unique_formats[h] = f
-                sorted_formats = sorted(unique_formats.values(), key=lambda x: int(re.sub("[^0-9]", "", x["res"]) or 0), reverse=True)
+    def extract(self, url):
+        with metrics.timed("extract", url=url):
+            return extract_info(url)
+
+    def on_parsed(self, batch, url, info, error):
+        # 解析线程里回调，切回主线程显示
+        self.ui.post(("parsed", batch, url), self.show_result, batch, url, info, error)
 
+    def show_result(self, batch, url, info, error):
+        # 主线程里显示一条解析结果
+        if batch is not self.batch:
+            return
+        if batch.total > 1:
+            self.status_var.set(f"⏳ {batch.progress_text()}" if batch.done < batch.total
+                                else f"✅ {batch.progress_text()}")
+        if error is not None:
+            if batch.total == 1:
+                self.status_var.set("❌ 解析出错")
+            self.results.add_error(url, str(error))
+        elif info is not None:
+            self.show_formats(url, info, batch.total == 1)
+
+    # 显示一篇笔记的各个版本
+    def show_formats(self, url, info, single=True):
+        try:
+            title = info.get("title", "xhs_video")
+            video_id = info.get("id", "")
+            # 去重同分辨率，选最高码率
+            sorted_formats = best_per_resolution(collect_formats(info), key="res")
+            # 图文 / 图片加视频的笔记：图片和视频一起下到笔记文件夹里
+            assets = note_assets(info)
+            if not sorted_formats and not assets:
+                if single:
+                    self.status_var.set("❌ 解析失败：未找到可用视频或图片")
+                self.results.add_error(url, "未找到可用视频或图片")
+                return
+
+            if single:
                 self.status_var.set(f"✅ 解析成功: {title[:30]}...")
-                self.result_box.insert(tk.END, f"视频标题: {title}\n" + "-"*40 + "\n")
+            item = self.results.add_item(title, url)
+
+            if assets and any(a["kind"] == "image" for a in assets):
+                self.results.add_format(item, (GALLERY, url, title, video_id), "全部", "",
+                                        info=asset_summary(assets))
+
+            rows = {}
+            for f in sorted_formats:
+                rows[f['id']] = self.results.add_format(item, (f['id'], url, title, video_id), f['res'], f['size_str'],
+                                                        f['height'], f['size_bytes'])
 
-                for f in sorted_formats:
-                    btn_text = f"下载 {f['res']} ({f['size_str']})"
-                    btn = tk.Button(self.result_box, text=btn_text, cursor="hand2", bg="#f0f0f0",
-                                    command=lambda fid=f['id'], u=url, t=title, vid=video_id: self.start_download(fid, u, t, vid))
-                    self.result_box.window_create(tk.END, window=btn)
-                    self.result_box.insert(tk.END, "\n\n")
+            # 列表先出来，没有大小的格式在后台并发探测，探到一个填一个
+            size_prober.fill(info, sorted_formats, lambda fid, size, approx:
+                             self.ui.post(("size", rows[fid]), self.results.set_size, rows[fid],
+                                          format_size(size, approx), size))
 
         except Exception as e:
-            self.status_var.set("❌ 解析出错")
-            self.result_box.insert(tk.END, f"错误信息: {str(e)}\n")
+            self.set_status("❌ 解析出错")
+            self.results.add_error(url, str(e))
 
     # 开始下载
-    def start_download(self, fmt_id, url, title, video_id):
-        if self.downloading:
-            self.status_var.set("❌ 当前已有任务在下载")
+    def start_download(self, fmt_id, url, title, video_id, entry_id=None):
+        if entry_id is None:
+            entry_id = self.journal.add("xiaohongshu", f"{url}#{fmt_id}", [fmt_id, url, title, video_id])
+        if self.journal.is_live(entry_id):
+            self.status_var.set(f"⏳ 已在下载队列中: {title[:30]}")
             return
-        self.downloading = True
-        threading.Thread(target=self.download_task, args=(fmt_id, url, title, video_id), daemon=True).start()
+        if fmt_id == GALLERY:
+            job = self.jobs.submit(self.gallery_task, url, title, video_id, entry_id,
+                                   name=f"{sanitize_filename(title)}/")
+        else:
+            job = self.jobs.submit(self.download_task, fmt_id, url, title, video_id, entry_id,
+                                   name=f"{sanitize_filename(title)}.mp4")
+        self.journal.bind(entry_id, job)
+        self.status_var.set(f"➕ 已加入下载队列: {title[:30]}")
 
     # 下载逻辑 + 自动生成不重复文件名
-    def download_task(self, fmt_id, url, title, video_id):
-        save_path = path_var.get()
-        safe_title = sanitize_filename(title)
-
-        # 自动生成不重复文件名
-        base_name = safe_title
-        ext = "mp4"
-        candidate = f"{base_name}.{ext}"
-        i = 1
-        while os.path.exists(os.path.join(save_path, candidate)):
-            candidate = f"{base_name} ({i}).{ext}"
-            i += 1
-
-        final_filename = candidate
-        outtmpl = os.path.join(save_path, final_filename.replace(".mp4", ".%(ext)s"))
-
-        self.status_var.set(f"⬇️ 下载中: {final_filename}")
-        self.progress['value'] = 0
-
-        def progress_hook(d):
-            if d['status'] == 'downloading':
-                try:
-                    p = d.get('_percent_str', '0%').replace('%','')
-                    self.progress['value'] = float(p)
-                    self.status_var.set(f"⬇️ 下载中 {d.get('_percent_str')} | 速度: {d.get('_speed_str')}")
-                except:
-                    pass
-            elif d['status'] == 'finished':
-                self.progress['value'] = 100
-                self.status_var.set(f"✅ 下载完成: {final_filename}")
-
-        ydl_opts = {
-            "format": f"{fmt_id}/best",
-            "outtmpl": outtmpl,
-            "progress_hooks": [progress_hook],
-            "quiet": True,
-            "no_warnings": True,
-        }
+    def download_task(self, job, fmt_id, url, title, video_id, entry_id):
+        job.journal_id = entry_id
+        existing = self.archive.lookup("xiaohongshu", video_id, fmt_id)
+        if existing:
+            self.set_status(f"✅ 已下载过，跳过: {os.path.basename(existing)}")
+            return
+
+        # 自动生成不重复文件名（从存档索引里原子分配，并发任务不会拿到同一个名字）；
+        # 恢复的任务沿用上次分配的文件名，才能续传
+        final_path = self.journal.get(entry_id)["final_path"]
+        if not final_path:
+            final_path = self.archive.allocate_path(path_var.get(), sanitize_filename(title), "mp4")
+        self.journal.update(entry_id, STAGE_DOWNLOADING, final_path=final_path)
+        final_filename = os.path.basename(final_path)
+        outtmpl = final_path[:-len(".mp4")] + ".%(ext)s"
+
+        self.set_status(f"⬇️ 下载中: {final_filename}")
+
+        try:
+            path = download_video(job, url, format_string(fmt_id, False), outtmpl)
+        except JobCancelled:
+            self.set_status(f"⛔ 已取消: {final_filename}")
+            raise
+        except Exception as e:
+            self.set_status(f"❌ 下载失败: {str(e)}")
+            raise
+        with stage(job, "finalize"):
+            _, deduped = self.archive.record("xiaohongshu", video_id, fmt_id, path or final_path)
+        self.set_status(f"✅ 下载完成: {final_filename}" + ("（内容与已有文件相同，已硬链接）" if deduped else ""))
+
+    # 下载整篇笔记：所有图片和视频并发下载到“标题_笔记id”文件夹，
+    # 每个文件先写 .part 再改名，重新排队时已下完的文件直接跳过
+    def gallery_task(self, job, url, title, video_id, entry_id):
+        job.journal_id = entry_id
+        with stage(job, "extract", url=url):
+            assets = note_assets(extract_info(url))
+        if not assets:
+            raise RuntimeError("未找到可用视频或图片")
+        if all(self.archive.lookup("xiaohongshu", video_id, f"{GALLERY}:{a['name']}") for a in assets):
+            self.set_status(f"✅ 已下载过，跳过: {title[:30]}")
+            return
+
+        folder = self.journal.get(entry_id)["final_path"]
+        if not folder:
+            folder = os.path.join(path_var.get(), f"{sanitize_filename(title) or 'xhs'}_{video_id}")
+        self.journal.update(entry_id, STAGE_DOWNLOADING, final_path=folder)
+        self.set_status(f"⬇️ 下载中: {os.path.basename(folder)}（{asset_summary(assets)}）")
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
+            with stage(job, "download", assets=len(assets)) as timing:
+                results, received = asset_fetcher.fetch(job, assets, folder)
+                timing.update(bytes=received)
+        except JobCancelled:
+            self.set_status(f"⛔ 已取消: {os.path.basename(folder)}")
+            raise
         except Exception as e:
-            self.status_var.set(f"❌ 下载失败: {str(e)}")
-        finally:
-            self.downloading = False
+            self.set_status(f"❌ 下载失败: {str(e)}")
+            raise
+        with stage(job, "finalize"):
+            for asset, path in results:
+                self.archive.record("xiaohongshu", video_id, f"{GALLERY}:{asset['name']}", path)
+        self.set_status(f"✅ 下载完成: {os.path.basename(folder)}（{len(results)} 个文件）")
 
 
 # --------------------
@@ -177,5 +249,7 @@ class XHSDownloaderApp:
 # --------------------
 if __name__ == "__main__":
     root = tk.Tk()
+    warm = warm_up(sites=("XiaoHongShu",))
     app = XHSDownloaderApp(root)
+    track_startup(root, "xiaohongshu", STARTED, warm)
     root.mainloop()
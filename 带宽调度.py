@@ -0,0 +1,69 @@
+﻿import time
+import threading
+
+BURST_SECONDS = 0.5      # 令牌桶容量：最多攒半秒的流量
+MAX_WAIT = 0.25          # 单次等待上限，限速被调整后能尽快生效
+
+
+# --------------------
+# 全局带宽调度：所有下载共用一个令牌桶（总限速），限速时按加权公平排队（WFQ）：
+# 每个任务按“已用流量 / 权重”排先后，大文件不会饿死短视频；标了优先的任务总是先拿到令牌
+# --------------------
+class BandwidthScheduler:
+    def __init__(self, limit=0):
+        self.limit = limit           # 字节/秒，0 表示不限速
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self._vclock = 0.0
+        self._finish = {}            # job.id -> 该任务上一块数据的虚拟完成时间
+        self._waiting = {}           # 等待令牌的请求 -> (是否优先, 虚拟完成时间)
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    def set_limit(self, limit):
+        with self._cond:
+            self._refill()
+            self.limit = max(0, int(limit or 0))
+            self._tokens = min(self._tokens, self.limit * BURST_SECONDS)
+            self._cond.notify_all()
+
+    def consume(self, job, nbytes):
+        # 在下载线程里调用（yt-dlp 进度回调），阻塞到这块数据“付得起”为止；
+        # 允许透支：一块比桶还大时先放行，之后的请求等令牌补回来
+        if nbytes <= 0:
+            return
+        with self._cond:
+            if not self.limit:
+                return
+            weight = max(getattr(job, "weight", 1.0), 0.01)
+            tag = max(self._vclock, self._finish.get(job.id, 0.0)) + nbytes / weight
+            self._finish[job.id] = tag
+            self._seq += 1
+            key = self._seq
+            self._waiting[key] = (not getattr(job, "priority", False), tag, key)
+            try:
+                while True:
+                    if not self.limit:
+                        return
+                    self._refill()
+                    if self._tokens >= 0 and min(self._waiting.values()) == self._waiting[key]:
+                        self._tokens -= nbytes
+                        self._vclock = max(self._vclock, tag)
+                        return
+                    deficit = -self._tokens if self._tokens < 0 else nbytes
+                    self._cond.wait(min(MAX_WAIT, deficit / self.limit))
+            finally:
+                del self._waiting[key]
+                self._cond.notify_all()
+
+    def forget(self, job):
+        with self._cond:
+            self._finish.pop(job.id, None)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.limit * BURST_SECONDS, self._tokens + (now - self._last) * self.limit)
+        self._last = now
+
+
+bandwidth = BandwidthScheduler()
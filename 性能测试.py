@@ -0,0 +1,367 @@
+﻿import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import platform
+import argparse
+import functools
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from 解析缓存 import extract_info, ExtractCache
+from 下载核心 import collect_formats, best_per_resolution, download_video
+from 转码工具 import get_ffmpeg_path, check_ffmpeg, transcode_video
+from 任务队列 import JobQueue, MERGING
+from 主页采集 import PAGE_WINDOW, _iter_entries
+
+# --------------------
+# 离线性能测试：本地 HTTP 服务模拟推特/小红书的视频源（整段 MP4 + HLS 分片），
+# 用替身解析器返回同样结构的 formats，测解析延迟、单任务/多任务下载吞吐、合并/转码耗时和峰值内存，
+# 结果写成 JSON，方便不同提交之间对比：
+#   python 性能测试.py -o bench.json
+#   python 性能测试.py -o new.json --compare bench.json
+# --------------------
+RESOLUTIONS = [(640, 360, 800), (1280, 720, 2500), (1920, 1080, 5000)]   # 宽, 高, 码率 kbps
+AUDIO_KBPS = 128
+HLS_SEGMENT_SECONDS = 2
+
+
+# ---------------- 本地媒体服务 ----------------
+class MediaHandler(SimpleHTTPRequestHandler):
+    latency = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(root, latency=0.0):
+    handler = type("Handler", (MediaHandler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(handler, directory=root))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _ffmpeg(*args):
+    subprocess.run([get_ffmpeg_path(), "-y", "-loglevel", "error", *args], check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def _random_file(path, size):
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            chunk = min(remaining, 1024 * 1024)
+            f.write(os.urandom(chunk))
+            remaining -= chunk
+
+
+def _write_playlist(folder, count):
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{HLS_SEGMENT_SECONDS}",
+             "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:VOD"]
+    for i in range(count):
+        lines += [f"#EXTINF:{HLS_SEGMENT_SECONDS}.0,", f"seg{i:03d}.ts"]
+    lines.append("#EXT-X-ENDLIST")
+    with open(os.path.join(folder, "index.m3u8"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def build_media(root, duration, real_media):
+    # 有 ffmpeg 时生成真正能播放、能合并转码的测试片源；没有时用随机字节，只测下载
+    os.makedirs(os.path.join(root, "hls", "audio"), exist_ok=True)
+    segments = max(1, duration // HLS_SEGMENT_SECONDS)
+    for width, height, kbps in RESOLUTIONS:
+        mp4 = os.path.join(root, f"{height}.mp4")
+        hls = os.path.join(root, "hls", str(height))
+        os.makedirs(hls, exist_ok=True)
+        if real_media:
+            _ffmpeg("-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate=30:duration={duration}",
+                    "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+                    "-c:v", "libx264", "-preset", "ultrafast", "-b:v", f"{kbps}k",
+                    "-c:a", "aac", "-b:a", f"{AUDIO_KBPS}k", "-shortest", mp4)
+            _ffmpeg("-i", mp4, "-map", "0:v", "-c", "copy", "-f", "hls", "-hls_time", str(HLS_SEGMENT_SECONDS),
+                    "-hls_playlist_type", "vod", "-hls_segment_filename", os.path.join(hls, "seg%03d.ts"),
+                    os.path.join(hls, "index.m3u8"))
+        else:
+            _random_file(mp4, (kbps + AUDIO_KBPS) * 1000 // 8 * duration)
+            for i in range(segments):
+                _random_file(os.path.join(hls, f"seg{i:03d}.ts"), kbps * 1000 // 8 * HLS_SEGMENT_SECONDS)
+            _write_playlist(hls, segments)
+    audio = os.path.join(root, "hls", "audio")
+    if real_media:
+        _ffmpeg("-i", os.path.join(root, f"{RESOLUTIONS[0][1]}.mp4"), "-map", "0:a", "-c", "copy", "-f", "hls",
+                "-hls_time", str(HLS_SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+                "-hls_segment_filename", os.path.join(audio, "seg%03d.ts"), os.path.join(audio, "index.m3u8"))
+    else:
+        for i in range(segments):
+            _random_file(os.path.join(audio, f"seg{i:03d}.ts"), AUDIO_KBPS * 1000 // 8 * HLS_SEGMENT_SECONDS)
+        _write_playlist(audio, segments)
+
+
+# ---------------- 替身解析器 ----------------
+def install_stub_extractors(base, media_root, duration):
+    # 让 127.0.0.1 上的 /twitter/<id>、/xhs/<id> 链接由替身解析器处理，返回与真实站点同结构的 formats
+    import yt_dlp
+    from yt_dlp.extractor.common import InfoExtractor
+
+    def mp4_formats(prefix):
+        return [{"format_id": f"{prefix}-{kbps}", "url": f"{base}/{h}.mp4", "ext": "mp4", "protocol": "https",
+                 "width": w, "height": h, "tbr": kbps + AUDIO_KBPS, "vcodec": "avc1.64001F", "acodec": "mp4a.40.2",
+                 "filesize": os.path.getsize(os.path.join(media_root, f"{h}.mp4"))}
+                for w, h, kbps in RESOLUTIONS]
+
+    class StubTwitterIE(InfoExtractor):
+        IE_NAME = "stub:twitter"
+        _VALID_URL = r"https?://127\.0\.0\.1:\d+/twitter/(?P<id>\w+)"
+
+        def _real_extract(self, url):
+            video_id = self._match_id(url)
+            formats = mp4_formats("http")
+            formats += [{"format_id": f"hls-{kbps}", "url": f"{base}/hls/{h}/index.m3u8", "ext": "mp4",
+                         "protocol": "m3u8_native", "width": w, "height": h, "tbr": kbps,
+                         "vcodec": "avc1.64001F", "acodec": "none"} for w, h, kbps in RESOLUTIONS]
+            formats.append({"format_id": "hls-audio", "url": f"{base}/hls/audio/index.m3u8", "ext": "mp4",
+                            "protocol": "m3u8_native", "tbr": AUDIO_KBPS, "vcodec": "none", "acodec": "mp4a.40.2"})
+            return {"id": video_id, "title": f"stub tweet {video_id}", "duration": duration,
+                    "description": "@someone benchmark tweet text", "formats": formats}
+
+    class StubXiaoHongShuIE(InfoExtractor):
+        IE_NAME = "stub:xiaohongshu"
+        _VALID_URL = r"https?://127\.0\.0\.1:\d+/xhs/(?P<id>\w+)"
+
+        def _real_extract(self, url):
+            video_id = self._match_id(url)
+            return {"id": video_id, "title": f"stub note {video_id}", "duration": duration,
+                    "formats": mp4_formats("h264")}
+
+    original = yt_dlp.YoutubeDL.add_default_info_extractors
+
+    def add_default_info_extractors(self):
+        for ie in (StubTwitterIE, StubXiaoHongShuIE):
+            self.add_info_extractor(ie())
+        original(self)
+
+    yt_dlp.YoutubeDL.add_default_info_extractors = add_default_info_extractors
+
+
+# ---------------- 各项测量 ----------------
+def _stats(samples):
+    samples = sorted(samples)
+    return {"n": len(samples), "mean": round(sum(samples) / len(samples), 4),
+            "p50": round(samples[len(samples) // 2], 4),
+            "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+            "max": round(samples[-1], 4)}
+
+
+def bench_parse(base, rounds):
+    result = {}
+    for site in ("twitter", "xhs"):
+        cold, warm, select = [], [], []
+        cache = ExtractCache()
+        for i in range(rounds):
+            url = f"{base}/{site}/{site}{i}"
+            started = time.perf_counter()
+            info = extract_info(url, cache=cache)
+            cold.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            extract_info(url, cache=cache)
+            warm.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            best_per_resolution(collect_formats(info))
+            select.append(time.perf_counter() - started)
+        result[site] = {"extract": _stats(cold), "cached": _stats(warm), "select_formats": _stats(select)}
+    return result
+
+
+def _run_downloads(tasks, workers, ffmpeg_path=None):
+    # tasks: [(url, 格式, 输出路径)]，返回 (总字节, 耗时, 各任务合并耗时)
+    jobs = JobQueue(workers)
+    merge_started = {}
+    jobs.add_listener(lambda job: job.state == MERGING and merge_started.setdefault(job.id, time.perf_counter()))
+    finished = {}
+
+    def task(job, url, fmt_str, outtmpl):
+        path = download_video(job, url, fmt_str, outtmpl, ffmpeg_path=ffmpeg_path)
+        finished[job.id] = (path, time.perf_counter())
+
+    started = time.perf_counter()
+    for url, fmt_str, outtmpl in tasks:
+        jobs.submit(task, url, fmt_str, outtmpl)
+    jobs.join()
+    elapsed = time.perf_counter() - started
+    errors = [str(job.error) for job in jobs.jobs if job.error is not None]
+    if errors:
+        raise RuntimeError(errors[0])
+    size = sum(os.path.getsize(path) for path, _ in finished.values() if path and os.path.exists(path))
+    merges = [finished[job_id][1] - t for job_id, t in merge_started.items() if job_id in finished]
+    return size, elapsed, merges
+
+
+def bench_download(base, out_dir, jobs_count, workers):
+    result = {}
+    top = RESOLUTIONS[-1]
+    cases = {
+        "progressive_single": ([(f"{base}/twitter/dl0", f"http-{top[2]}", "p0")], 1),
+        "hls_single": ([(f"{base}/twitter/dl1", f"hls-{top[2]}", "h0")], 1),
+        "progressive_multi": ([(f"{base}/xhs/dl{i}", f"h264-{top[2]}", f"m{i}") for i in range(jobs_count)], workers),
+        "hls_multi": ([(f"{base}/twitter/hl{i}", f"hls-{top[2]}", f"n{i}") for i in range(jobs_count)], workers),
+    }
+    for name, (tasks, n) in cases.items():
+        folder = os.path.join(out_dir, name)
+        os.makedirs(folder, exist_ok=True)
+        tasks = [(url, fmt, os.path.join(folder, f"{stem}.%(ext)s")) for url, fmt, stem in tasks]
+        try:
+            size, elapsed, _ = _run_downloads(tasks, n)
+            result[name] = {"jobs": len(tasks), "workers": n, "bytes": size, "seconds": round(elapsed, 3),
+                            "mb_per_s": round(size / elapsed / 1024 / 1024, 2)}
+        except Exception as e:
+            result[name] = {"error": str(e)}
+    return result
+
+
+def bench_media(base, media_root, out_dir, duration, real_media):
+    # 每个分辨率：HLS 视频+音频下载后合并，然后把成品转成 H.264/AAC
+    if not real_media:
+        return {"skipped": "未检测到 FFmpeg"}
+    result = {}
+    for width, height, kbps in RESOLUTIONS:
+        folder = os.path.join(out_dir, f"media{height}")
+        os.makedirs(folder, exist_ok=True)
+        entry = {}
+        try:
+            tasks = [(f"{base}/twitter/m{height}", f"hls-{kbps}+hls-audio", os.path.join(folder, "merged.%(ext)s"))]
+            _, _, merges = _run_downloads(tasks, 1, ffmpeg_path=get_ffmpeg_path())
+            entry["merge_seconds"] = round(merges[0], 3) if merges else None
+        except Exception as e:
+            entry["merge_error"] = str(e)
+        try:
+            started = time.perf_counter()
+            mode, reason = transcode_video(os.path.join(media_root, f"{height}.mp4"),
+                                           os.path.join(folder, "transcoded.mp4"))
+            elapsed = time.perf_counter() - started
+            entry.update(transcode_mode=mode, transcode_seconds=round(elapsed, 3),
+                         speed_factor=round(duration / elapsed, 2) if elapsed else None)
+        except Exception as e:
+            entry["transcode_error"] = str(e)
+        result[f"{height}p"] = entry
+    return result
+
+
+def bench_harvest(count, page_size=20):
+    # 主页采集：逐个走完 count 个条目的分页列表（替身分页函数，不联网），看 yt-dlp 的页缓存是不是一直有界
+    from yt_dlp.utils import OnDemandPagedList
+    fetched = []
+
+    def page(n):
+        fetched.append(n)
+        return [{"id": str(i)} for i in range(n * page_size, min(count, (n + 1) * page_size))]
+
+    entries = OnDemandPagedList(page, page_size)
+    limit = PAGE_WINDOW // page_size + 2
+    walked = max_cached = 0
+    started = time.perf_counter()
+    for _ in _iter_entries(entries, 0):
+        walked += 1
+        max_cached = max(max_cached, len(entries._cache))
+    elapsed = time.perf_counter() - started
+    result = {"entries": walked, "pages_fetched": len(fetched), "max_cached_pages": max_cached,
+              "seconds": round(elapsed, 3)}
+    if walked != count or max_cached > limit:
+        result["error"] = f"走了 {walked}/{count} 个条目，最多缓存 {max_cached} 页（上限 {limit}）"
+    return result
+
+
+def peak_rss():
+    # Linux 上单位是 KB，macOS 上是字节；Windows 没有 resource 模块
+    try:
+        import resource
+    except ImportError:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {"self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale}
+
+
+def environment():
+    import yt_dlp.version
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "yt_dlp": yt_dlp.version.__version__, "ffmpeg": check_ffmpeg(), "cpus": os.cpu_count()}
+
+
+# ---------------- 对比 ----------------
+def _flatten(data, prefix=""):
+    for key, value in data.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def compare(old, new):
+    old_values = dict(_flatten(old["results"]))
+    for key, value in _flatten(new["results"]):
+        if key in old_values and old_values[key]:
+            change = (value - old_values[key]) / old_values[key] * 100
+            print(f"{key:60s} {old_values[key]:>12} -> {value:>12} ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="离线性能测试（本地服务 + 替身解析器，不需要联网）")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="结果 JSON 文件")
+    parser.add_argument("--compare", help="与之前的结果文件对比并打印变化")
+    parser.add_argument("--duration", type=int, default=10, help="测试片源时长（秒）")
+    parser.add_argument("--rounds", type=int, default=20, help="解析测试次数")
+    parser.add_argument("--jobs", type=int, default=6, help="多任务下载的任务数")
+    parser.add_argument("--workers", type=int, default=3, help="多任务下载的并发数")
+    parser.add_argument("--harvest", type=int, default=10000, help="主页采集测试的条目数")
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟每个请求的网络延迟（毫秒）")
+    parser.add_argument("--no-ffmpeg", action="store_true", help="不用 FFmpeg 生成片源，跳过合并/转码测试")
+    args = parser.parse_args(argv)
+
+    work = tempfile.mkdtemp(prefix="bench_")
+    try:
+        media_root = os.path.join(work, "media")
+        out_dir = os.path.join(work, "out")
+        os.makedirs(media_root)
+        real_media = check_ffmpeg() and not args.no_ffmpeg
+        build_media(media_root, args.duration, real_media)
+        server, base = start_server(media_root, args.latency / 1000.0)
+        install_stub_extractors(base, media_root, args.duration)
+
+        started = time.perf_counter()
+        results = {
+            "parse": bench_parse(base, args.rounds),
+            "download": bench_download(base, out_dir, args.jobs, args.workers),
+            "media": bench_media(base, media_root, out_dir, args.duration, real_media),
+            "harvest": bench_harvest(args.harvest),
+        }
+        results["total_seconds"] = round(time.perf_counter() - started, 3)
+        results["peak_rss"] = peak_rss()
+        server.shutdown()
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    report = {"time": round(time.time()), "environment": environment(), "settings": vars(args), "results": results}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
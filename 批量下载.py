@@ -0,0 +1,252 @@
+﻿import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import threading
+
+from 解析缓存 import extract_info, resolve_formats, video_key
+from 下载核心 import sanitize_filename, collect_formats, select_format, format_string, download_video
+from 大小探测 import size_prober
+from 分片下载 import FragmentStats
+from 带宽调度 import bandwidth
+from 任务指标 import metrics, stage, METRICS_FILE, PROM_FILE
+from 转码工具 import get_ffmpeg_path, check_ffmpeg, transcode_video, stream_transcode, plan_stream, speed_factor, job_hooks, TranscodePool, FULL
+from 任务队列 import JobQueue, JobCancelled, TRANSCODING, DEFAULT_MAX_WORKERS
+from 下载存档 import DownloadArchive, ARCHIVE_FILE
+from 主页采集 import Harvester, HARVEST_AHEAD
+from 任务日志 import JobJournal, JOURNAL_FILE, STAGE_DOWNLOADING, STAGE_DOWNLOADED, STAGE_TRANSCODING
+
+# --------------------
+# 无界面批量下载：每行一个链接，每个链接输出一行 JSON 结果
+#   python 批量下载.py urls.txt -o downloads --max-height 1080 --workers 4 > results.jsonl
+#   type urls.txt | python 批量下载.py - --transcode
+#   python 批量下载.py profiles.txt --harvest      # 每行是主页 / 列表 / 搜索链接，边枚举边下载
+# --------------------
+_SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(text):
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in _SIZE_UNITS:
+        return int(float(text[:-1]) * _SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def read_urls(source):
+    stream = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+    with stream:
+        seen = set()
+        for line in stream:
+            url = line.strip()
+            if url and not url.startswith("#") and url not in seen:
+                seen.add(url)
+                yield url
+
+
+class BatchDownloader:
+    def __init__(self, args):
+        self.args = args
+        self.jobs = JobQueue(args.workers)
+        self.transcoder = TranscodePool() if args.transcode else None
+        self.ffmpeg_path = get_ffmpeg_path() if check_ffmpeg() else None
+        self.archive = DownloadArchive(args.archive)
+        self.journal = JobJournal(args.journal)
+        self.journal.watch(self.jobs)
+        self.harvester = Harvester(self.journal, self.archive)
+        self.failed = 0
+        bandwidth.set_limit(args.limit_rate or 0)
+        metrics.configure(args.metrics or None, args.prom or None)
+        metrics.watch(self.jobs)
+        self.out_lock = threading.Lock()
+        self.out = open(args.results, "a", encoding="utf-8") if args.results else sys.stdout
+
+    def write_result(self, result):
+        with self.out_lock:
+            self.out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            self.out.flush()
+
+    def run(self, urls):
+        pending = []
+        if self.args.resume:
+            # 先把上次没跑完的链接排回队列；输入里重复的链接会复用同一条日志记录
+            pending = [entry["args"][0] for entry in self.journal.pending("cli")]
+        if self.args.harvest:
+            urls = self.harvest(urls)
+        # 链接是边读（边采集）边提交的：未结束的任务攒够了就先等一等，内存不随链接总数增长
+        resumed = set(pending)
+        for url in itertools.chain(pending, (url for url in urls if url not in resumed)):
+            self.jobs.wait_for_room(self.args.workers + HARVEST_AHEAD)
+            self.prune()
+            result = {"url": url, "status": "queued"}
+            self.jobs.submit(self.process, url, result, self.journal.add("cli", url, [url]), name=url)
+        self.jobs.join()
+        self.prune()
+        return 1 if self.failed else 0
+
+    def prune(self):
+        self.failed += sum(1 for job in self.jobs.prune() if job.error is not None)
+
+    def harvest(self, sources):
+        # 逐个展开主页 / 列表 / 搜索链接；存档里已有的条目直接输出 skipped，不进队列
+        for source in sources:
+            try:
+                yield from self.harvester.walk(source, on_skip=lambda url, path: self.skip(
+                    {"url": url, "source": source}, time.time(), path))
+            except Exception as e:
+                self.failed += 1
+                self.write_result({"url": source, "status": "failed", "error": str(e)})
+
+    def process(self, job, url, result, entry_id):
+        job.journal_id = entry_id
+        started = time.time()
+        try:
+            # 链接里就能认出 id 的，联网前先查存档
+            key = video_key(url)
+            existing = self.archive.lookup(*key) if key and not self.transcoder else None
+            if existing:
+                self.skip(result, started, existing)
+                return
+
+            with stage(job, "extract", url=url):
+                info = extract_info(url)
+            result.update(id=info.get("id"), title=info.get("title"), extractor=info.get("extractor_key"))
+            with stage(job, "select"):
+                formats = collect_formats(info)
+                if self.args.max_size:
+                    # 大小上限要对得上：先把没有大小的格式探测出来
+                    size_prober.resolve(info, formats)
+                if not formats:
+                    raise RuntimeError("未找到可用视频")
+                fmt = select_format(formats, self.args.max_height, self.args.max_size, self.args.fallback_smallest)
+                if fmt is None:
+                    raise RuntimeError("没有符合 --max-height / --max-size 的版本（加 --fallback-smallest 改为下载最小的版本）")
+            result.update(format_id=fmt["id"], resolution=fmt["res"])
+
+            site = (info.get("extractor_key") or "video").lower()
+            archive_key = (site, info.get("id"), f"{fmt['id']}+h264" if self.transcoder else fmt["id"])
+            existing = self.archive.lookup(*archive_key)
+            if existing:
+                self.skip(result, started, existing)
+                return
+
+            # 上次中断的任务沿用当时分配的文件名，yt-dlp 才能接着 .part 续传
+            entry = self.journal.get(entry_id)
+            final_file = entry["final_path"]
+            if not final_file:
+                base = sanitize_filename(info.get("title") or "")[:80] or site
+                base = f"{base} [{info.get('id', job.id)}]"
+                os.makedirs(self.args.output, exist_ok=True)
+                final_file = self.archive.allocate_path(self.args.output, base, "mp4")
+            if entry["stage"] not in (STAGE_DOWNLOADED, STAGE_TRANSCODING):
+                self.journal.update(entry_id, STAGE_DOWNLOADING, final_path=final_file)
+            fmt_str = format_string(fmt["id"], bool(self.ffmpeg_path))
+
+            if self.transcoder:
+                future = self.transcode(job, url, fmt_str, final_file, entry)
+                if future is None:
+                    self.finish(job, result, started, final_file, None, archive_key)
+                    return
+                future.add_done_callback(
+                    lambda f: self.finish(job, result, started, final_file, f.exception(), archive_key))
+                return future
+
+            outtmpl = final_file[:-len(".mp4")] + ".%(ext)s"
+            fragments = FragmentStats()
+            path = download_video(job, url, fmt_str, outtmpl, ffmpeg_path=self.ffmpeg_path, fragments=fragments)
+            if fragments.count:
+                result["fragments"] = fragments.summary()
+            self.finish(job, result, started, path or final_file, None, archive_key)
+        except Exception as e:
+            self.finish(job, result, started, None, e)
+            raise
+
+    # 在下载槽位里执行：优先边下边转，失败再先下载后转码；临时文件已下完的只重做转码。
+    # 只有真正的 libx264 编码占转码池的槽位：完整转码的边下边转在这里等着它做完，
+    # 下载后的转码交给转码池并返回 Future（下载槽位先释放）；只换封装 / 只转音频直接做完，返回 None
+    def transcode(self, job, url, fmt_str, final_file, entry):
+        tmp_file = final_file[:-len(".mp4")] + "_tmp.mp4"
+        if not (entry["stage"] in (STAGE_DOWNLOADED, STAGE_TRANSCODING) and os.path.exists(tmp_file)):
+            try:
+                formats = resolve_formats(url, fmt_str)
+                plan = plan_stream(formats)
+                if plan[0] == FULL:
+                    job.update(state=TRANSCODING, message="等待转码")
+                    self.transcoder.run(job, self._stream, job, formats, plan, final_file)
+                else:
+                    self._stream(job, formats, plan, final_file)
+                return None
+            except JobCancelled:
+                raise
+            except Exception:
+                job.checkpoint()
+            download_video(job, url, fmt_str, tmp_file, ffmpeg_path=self.ffmpeg_path)
+            self.journal.update(entry["id"], STAGE_DOWNLOADED, tmp_path=tmp_file)
+        job.update(state=TRANSCODING, message="等待转码")
+        return self.transcoder.submit(self._transcode_tmp, job, tmp_file, final_file, entry["id"])
+
+    def _stream(self, job, formats, plan, final_file, threads=None):
+        job.update(state=TRANSCODING, message="")
+        with stage(job, "transcode", method="stream") as timing:
+            mode, reason = stream_transcode(formats, final_file, threads=threads, plan=plan,
+                                            timeout=self.args.transcode_timeout, **job_hooks(job))
+            timing.update(encoder=mode, speed_factor=speed_factor(final_file, job.metrics.elapsed(timing)))
+        return mode, reason
+
+    def _transcode_tmp(self, job, tmp_file, final_file, entry_id, threads=None):
+        job.update(state=TRANSCODING, message="")
+        self.journal.update(entry_id, STAGE_TRANSCODING)
+        with stage(job, "transcode", method="file") as timing:
+            mode, reason = transcode_video(tmp_file, final_file, threads=threads,
+                                           timeout=self.args.transcode_timeout, **job_hooks(job))
+            timing.update(encoder=mode, speed_factor=speed_factor(final_file, job.metrics.elapsed(timing)))
+        os.remove(tmp_file)
+        return mode, reason
+
+    def skip(self, result, started, path):
+        result.update(status="skipped", path=path, elapsed=round(time.time() - started, 3))
+        self.write_result(result)
+
+    def finish(self, job, result, started, path, error, archive_key=None):
+        result["elapsed"] = round(time.time() - started, 3)
+        if error is None:
+            result["status"] = "done"
+            result["path"] = path
+            if path and os.path.exists(path):
+                result["size"] = os.path.getsize(path)
+                if archive_key:
+                    with stage(job, "finalize"):
+                        _, result["deduped"] = self.archive.record(*archive_key, path)
+        else:
+            result["status"] = "cancelled" if isinstance(error, JobCancelled) else "failed"
+            result["error"] = str(error)
+        self.write_result(result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="推特/小红书视频批量下载（无界面）")
+    parser.add_argument("input", nargs="?", default="-", help="链接列表文件，每行一个；'-' 表示标准输入")
+    parser.add_argument("-o", "--output", default=os.path.join(os.getcwd(), "downloads"), help="保存目录")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_MAX_WORKERS, help="同时下载数")
+    parser.add_argument("--max-height", type=int, help="最高分辨率（高度），默认不限")
+    parser.add_argument("--max-size", type=parse_size, help="单个文件大小上限，如 200M、1.5G")
+    parser.add_argument("--fallback-smallest", action="store_true",
+                        help="没有符合 --max-height / --max-size 的版本时下载最小的版本，默认报失败")
+    parser.add_argument("--limit-rate", type=parse_size, help="所有下载合计的限速（每秒），如 5M")
+    parser.add_argument("--transcode", action="store_true", help="下载后统一转为 H.264/AAC")
+    parser.add_argument("--transcode-timeout", type=float, help="单个视频转码的超时秒数，默认不限")
+    parser.add_argument("--results", help="结果追加写入的 JSON lines 文件，默认输出到标准输出")
+    parser.add_argument("--archive", default=ARCHIVE_FILE, help="下载存档数据库，已下载过的视频会跳过")
+    parser.add_argument("--journal", default=JOURNAL_FILE, help="任务日志数据库，中断后可续传")
+    parser.add_argument("--metrics", default=METRICS_FILE, help="分阶段计时追加写入的 JSON lines 文件，留空不写")
+    parser.add_argument("--prom", default=PROM_FILE, help="Prometheus 文本格式指标文件，留空不写")
+    parser.add_argument("--resume", action="store_true", help="先继续上次没完成的任务")
+    parser.add_argument("--harvest", action="store_true",
+                        help="输入的是主页 / 列表 / 搜索链接：边枚举边下载，已下载过的跳过，中断后从上次的位置接着采集")
+    args = parser.parse_args(argv)
+    return BatchDownloader(args).run(read_urls(args.input))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,24 @@
-﻿import os
+﻿import time
+STARTED = time.perf_counter()  # 启动计时起点，放在其他导入之前
+
+import os
 import json
 import tkinter as tk
-from tkinter import filedialog, scrolledtext, ttk
-import threading
-import pyperclip
-import yt_dlp
-import humanize
+from tkinter import filedialog, ttk
 import shutil
-import re
+import functools
+from 解析缓存 import extract_info, ParseBatch
+from 下载核心 import sanitize_filename, collect_formats, best_per_resolution, format_string, format_size, download_video
+from 大小探测 import size_prober
+from 任务队列 import JobQueue, JobCancelled, DEFAULT_MAX_WORKERS
+from 任务列表 import JobListView, UiPump
+from 结果列表 import ResultListView
+from 带宽调度 import bandwidth
+from 剪贴板监听 import ClipboardWatcher, paste_urls
+from 下载存档 import DownloadArchive
+from 任务日志 import JobJournal, STAGE_DOWNLOADING
+from 启动预热 import warm_up, track_startup
+from 任务指标 import metrics, stage
 
 # --- 配置管理 ---
 CONFIG_FILE = "config.json"
@@ -16,13 +27,21 @@ def load_config():
     default_path = os.path.join(os.getcwd(), "downloads")
     if not os.path.exists(default_path):
         os.makedirs(default_path)
-    config = {"download_path": default_path}
+    # bandwidth_limit: 所有下载的总限速（字节/秒），0 为不限
+    config = {"download_path": default_path, "max_workers": DEFAULT_MAX_WORKERS, "watch_clipboard": False,
+              "bandwidth_limit": 0}
     if os.path.exists(CONFIG_FILE):
         try:
             with open(CONFIG_FILE, "r", encoding="utf-8") as f:
                 data = json.load(f)
                 if os.path.exists(data.get("download_path", "")):
                     config["download_path"] = data["download_path"]
+                if isinstance(data.get("max_workers"), int) and data["max_workers"] > 0:
+                    config["max_workers"] = data["max_workers"]
+                if isinstance(data.get("bandwidth_limit"), int) and data["bandwidth_limit"] >= 0:
+                    config["bandwidth_limit"] = data["bandwidth_limit"]
+                if isinstance(data.get("watch_clipboard"), bool):
+                    config["watch_clipboard"] = data["watch_clipboard"]
         except:
             pass
     return config
@@ -32,6 +51,7 @@ def save_config(config):
         json.dump(config, f)
 
 # --- FFmpeg 支持 ---
+@functools.lru_cache(maxsize=None)
 def get_ffmpeg_path():
     # 优先使用当前目录的 ffmpeg.exe
     local_ffmpeg = os.path.join(os.getcwd(), "ffmpeg.exe")
@@ -46,10 +66,6 @@ def get_ffmpeg_path():
 def has_ffmpeg():
     return get_ffmpeg_path() is not None
 
-def sanitize_filename(name):
-    name = re.sub(r'[\\/:*?"<>|]', '', name)
-    return name.strip()
-
 # --- 主程序界面 ---
 class TwitterDownloaderApp:
     def __init__(self, root):
@@ -58,7 +74,12 @@ class TwitterDownloaderApp:
         root.geometry("680x600")
         
         self.config = load_config()
-        self.downloading = False
+        self.jobs = JobQueue(self.config["max_workers"])
+        bandwidth.set_limit(self.config["bandwidth_limit"])
+        self.archive = DownloadArchive()
+        self.journal = JobJournal()
+        self.journal.watch(self.jobs)
+        metrics.watch(self.jobs)
         self.default_font = ("Microsoft YaHei", 10)
 
         # 1. 顶部：保存路径
@@ -84,6 +105,11 @@ class TwitterDownloaderApp:
         tk.Button(frame_btn, text="📋 粘贴并解析", command=self.parse_clipboard_url, bg="#e1f5fe", font=(self.default_font[0], 10, "bold"), width=15).pack(side="left", padx=10)
         self.top_btn = tk.Button(frame_btn, text="📌 置顶窗口", command=self.toggle_top, font=self.default_font)
         self.top_btn.pack(side="left", padx=10)
+        # 剪贴板监听：复制链接后立即在后台预解析
+        self.watch_var = tk.BooleanVar(value=self.config["watch_clipboard"])
+        tk.Checkbutton(frame_btn, text="👀 监听剪贴板", variable=self.watch_var, command=self.toggle_watch, font=self.default_font).pack(side="left")
+        self.watcher = ClipboardWatcher(root, on_found=self.on_clipboard_urls)
+        self.watcher.set_enabled(self.watch_var.get())
 
         # 4. 状态与进度
         self.status_var = tk.StringVar(value="准备就绪")
@@ -92,17 +118,25 @@ class TwitterDownloaderApp:
         self.progress = ttk.Progressbar(root, orient="horizontal", length=600, mode="determinate")
         self.progress.pack(padx=10, pady=5)
 
+        self.ui = UiPump(root)
+        self.job_view = JobListView(root, root, self.jobs, font=self.default_font,
+                                    on_workers_changed=self.set_max_workers,
+                                    on_limit_changed=self.set_bandwidth_limit,
+                                    pump=self.ui, progress=self.progress)
+
         # 5. 结果列表
-        tk.Label(root, text="解析结果 (点击对应按钮下载)：", anchor="w", font=self.default_font).pack(fill="x", padx=10, pady=(10, 0))
-        self.result_box = scrolledtext.ScrolledText(root, width=80, height=15, font=self.default_font)
-        self.result_box.pack(padx=10, pady=5, fill="both", expand=True)
+        self.results = ResultListView(root, root, lambda args: self.start_download(*args),
+                                      font=self.default_font, height=15)
         
         self.top_state = False
+        self.batch = None
 
         # FFmpeg 提示
         if not has_ffmpeg():
             tk.Label(root, text="⚠️ 未检测到 FFmpeg，将尝试下载兼容格式 (可能非最高画质)", fg="red", font=self.default_font).pack(pady=2)
 
+        self.resume_jobs()
+
     def select_folder(self):
         folder = filedialog.askdirectory()
         if folder:
@@ -110,134 +144,155 @@ class TwitterDownloaderApp:
             self.config["download_path"] = folder
             save_config(self.config)
 
+    def set_status(self, text):
+        # 工作线程里改状态栏：交给主线程统一刷新
+        self.ui.post("status", self.status_var.set, text)
+
+    def toggle_watch(self):
+        self.watcher.set_enabled(self.watch_var.get())
+        self.config["watch_clipboard"] = self.watch_var.get()
+        save_config(self.config)
+
+    def on_clipboard_urls(self, urls):
+        self.status_var.set(f"🔎 剪贴板发现 {len(urls)} 个新链接，后台预解析中...")
+
+    def set_max_workers(self, n):
+        self.config["max_workers"] = n
+        save_config(self.config)
+
+    def set_bandwidth_limit(self, limit):
+        self.config["bandwidth_limit"] = limit
+        save_config(self.config)
+
     def toggle_top(self):
         self.top_state = not self.top_state
         self.root.attributes("-topmost", self.top_state)
         self.top_btn.config(text="📍 取消置顶" if self.top_state else "📌 置顶窗口")
 
     def parse_clipboard_url(self):
-        try:
-            url = pyperclip.paste().strip()
-        except:
-            url = ""
-            
-        if not url or "http" not in url:
+        # 剪贴板里可以有多个链接：并发解析，哪个先解析完先显示哪个
+        urls = paste_urls()
+        if not urls:
             self.status_var.set("❌ 剪贴板没有有效链接")
             return
 
-        self.url_var.set(url)
-        self.status_var.set("⏳ 正在联网解析视频，请稍候...")
-        self.result_box.delete("1.0", tk.END)
-        threading.Thread(target=self.analyze, args=(url,), daemon=True).start()
-
-    def analyze(self, url):
+        self.url_var.set(" ".join(urls))
+        self.status_var.set("⏳ 正在联网解析视频，请稍候..." if len(urls) == 1
+                            else f"⏳ 正在联网解析 {len(urls)} 个链接，请稍候...")
+        self.results.clear()
+        if self.batch:
+            self.batch.cancel()
+        self.batch = ParseBatch(urls, self.on_parsed, extract=self.extract).start()
+
+    def extract(self, url):
+        with metrics.timed("extract", url=url):
+            return extract_info(url)
+
+    def on_parsed(self, batch, url, info, error):
+        # 解析线程里回调，切回主线程显示
+        self.ui.post(("parsed", batch, url), self.show_result, batch, url, info, error)
+
+    def show_result(self, batch, url, info, error):
+        # 主线程里显示一条解析结果
+        if batch is not self.batch:
+            return
+        if batch.total > 1:
+            self.status_var.set(f"⏳ {batch.progress_text()}" if batch.done < batch.total
+                                else f"✅ {batch.progress_text()}")
+        if error is not None:
+            if batch.total == 1:
+                self.status_var.set("❌ 解析出错")
+            self.results.add_error(url, str(error))
+        elif info is not None:
+            self.show_formats(url, info, batch.total == 1)
+
+    def show_formats(self, url, info, single=True):
         try:
-            ydl_opts = {"quiet": True, "no_warnings": True}
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                title = info.get("title", "twitter_video")
-                video_id = info.get("id", "")
-                formats = info.get("formats", [])
-
-                valid_formats = []
-                for f in formats:
-                    if f.get("vcodec") != 'none' and f.get("ext") == "mp4":
-                        filesize = f.get("filesize") or f.get("filesize_approx") or 0
-                        valid_formats.append({
-                            "id": f["format_id"],
-                            "res": f.get("resolution") or f"{f.get('width')}x{f.get('height')}",
-                            "height": f.get("height") or 0,
-                            "size_bytes": filesize,
-                            "size_str": humanize.naturalsize(filesize) if filesize > 0 else "未知大小",
-                            "tbr": f.get("tbr") or 0
-                        })
-
-                if not valid_formats:
+            title = info.get("title", "twitter_video")
+            video_id = info.get("id", "")
+            sorted_formats = best_per_resolution(collect_formats(info))
+            if not sorted_formats:
+                if single:
                     self.status_var.set("❌ 解析失败：未找到可用视频")
-                    return
-
-                unique_formats = {}
-                for f in valid_formats:
-                    h = f["height"]
-                    if h not in unique_formats or f["tbr"] > unique_formats[h]["tbr"]:
-                        unique_formats[h] = f
-                
-                sorted_formats = sorted(unique_formats.values(), key=lambda x: x["height"], reverse=True)
+                self.results.add_error(url, "未找到可用视频")
+                return
 
+            if single:
                 self.status_var.set(f"✅ 解析成功: {title[:30]}...")
-                self.result_box.insert(tk.END, f"视频标题: {title}\n")
-                self.result_box.insert(tk.END, "-" * 50 + "\n")
-
-                for f in sorted_formats:
-                    btn_text = f"下载 {f['res']} ({f['size_str']})"
-                    info_text = f"📺 分辨率: {f['res']} | 大小: {f['size_str']}  "
-                    self.result_box.insert(tk.END, info_text)
-                    
-                    btn = tk.Button(self.result_box, text=btn_text, cursor="hand2", bg="#f0f0f0",
-                                    font=self.default_font,
-                                    command=lambda fid=f['id'], u=url, t=title, vid=video_id: 
-                                    self.start_download(fid, u, t, vid))
-                    self.result_box.window_create(tk.END, window=btn)
-                    self.result_box.insert(tk.END, "\n\n")
-
-        except Exception as e:
-            self.status_var.set("❌ 解析出错")
-            self.result_box.insert(tk.END, f"错误信息: {str(e)}")
+            item = self.results.add_item(title, url)
+            rows = {}
+            for f in sorted_formats:
+                rows[f['id']] = self.results.add_format(item, (f['id'], url, title, video_id), f['res'], f['size_str'],
+                                                        f['height'], f['size_bytes'])
 
-    def start_download(self, fmt_id, url, title, video_id):
-        if self.downloading:
-            self.status_var.set("❌ 当前已有任务在下载，请等待完成")
-            return
-        self.downloading = True
-        threading.Thread(target=self.download_task, args=(fmt_id, url, title, video_id), daemon=True).start()
+            # 列表先出来，没有大小的格式在后台并发探测，探到一个填一个
+            size_prober.fill(info, sorted_formats, lambda fid, size, approx:
+                             self.ui.post(("size", rows[fid]), self.results.set_size, rows[fid],
+                                          format_size(size, approx), size))
 
-    def download_task(self, fmt_id, url, title, video_id):
-        save_path = self.path_var.get()
+        except Exception as e:
+            self.set_status("❌ 解析出错")
+            self.results.add_error(url, str(e))
+
+    def resume_jobs(self):
+        # 上次退出（或崩溃）时没完成的任务重新排队，yt-dlp 会接着 .part 文件续传
+        entries = self.journal.pending("twitter")
+        for entry in entries:
+            self.start_download(*entry["args"], entry_id=entry["id"])
+        if entries:
+            self.status_var.set(f"♻️ 已恢复 {len(entries)} 个未完成的任务")
+
+    def start_download(self, fmt_id, url, title, video_id, entry_id=None):
         safe_title = sanitize_filename(title)
         if not safe_title or len(safe_title) > 100:
             safe_title = f"twitter_{video_id}"
-        filename = f"{safe_title}.mp4"
-        outtmpl = os.path.join(save_path, f"{safe_title}.%(ext)s")
-
-        self.status_var.set(f"⬇️ 下载中: {filename}")
-        self.progress['value'] = 0
-
-        def progress_hook(d):
-            if d['status'] == 'downloading':
-                try:
-                    p = d.get('_percent_str', '0%').replace('%','')
-                    self.progress['value'] = float(p)
-                    self.status_var.set(f"⬇️ 下载中 {d.get('_percent_str')} | 速度: {d.get('_speed_str')}")
-                except:
-                    pass
-            elif d['status'] == 'finished':
-                self.progress['value'] = 100
-                self.status_var.set("✅ 下载完成")
-
-        # 使用本地 FFmpeg（保证最高画质）
-        ffmpeg_path = get_ffmpeg_path()
-        fmt_str = f"{fmt_id}+bestaudio/best" if ffmpeg_path else f"{fmt_id}/best"
+        if entry_id is None:
+            entry_id = self.journal.add("twitter", f"{url}#{fmt_id}", [fmt_id, url, title, video_id])
+        if self.journal.is_live(entry_id):
+            self.status_var.set(f"⏳ 已在下载队列中: {safe_title}.mp4")
+            return
+        job = self.jobs.submit(self.download_task, fmt_id, url, title, video_id, entry_id, name=f"{safe_title}.mp4")
+        self.journal.bind(entry_id, job)
+        self.status_var.set(f"➕ 已加入下载队列: {safe_title}.mp4")
+
+    def download_task(self, job, fmt_id, url, title, video_id, entry_id):
+        job.journal_id = entry_id
+        existing = self.archive.lookup("twitter", video_id, fmt_id)
+        if existing:
+            self.set_status(f"✅ 已下载过，跳过: {os.path.basename(existing)}")
+            return
 
-        ydl_opts = {
-            "format": fmt_str,
-            "outtmpl": outtmpl,
-            "progress_hooks": [progress_hook],
-            "quiet": True,
-            "no_warnings": True,
-        }
+        # 恢复的任务沿用上次分配的文件名，才能续传
+        final_path = self.journal.get(entry_id)["final_path"]
+        if not final_path:
+            safe_title = sanitize_filename(title)
+            if not safe_title or len(safe_title) > 100:
+                safe_title = f"twitter_{video_id}"
+            final_path = self.archive.allocate_path(self.path_var.get(), safe_title, "mp4")
+        self.journal.update(entry_id, STAGE_DOWNLOADING, final_path=final_path)
+        filename = os.path.basename(final_path)
+        outtmpl = final_path[:-len(".mp4")] + ".%(ext)s"
 
-        if ffmpeg_path:
-            ydl_opts["ffmpeg_location"] = ffmpeg_path
+        self.set_status(f"⬇️ 下载中: {filename}")
 
+        # 使用本地 FFmpeg（保证最高画质）
+        ffmpeg_path = get_ffmpeg_path()
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
+            path = download_video(job, url, format_string(fmt_id, bool(ffmpeg_path)), outtmpl,
+                                  ffmpeg_path=ffmpeg_path)
+        except JobCancelled:
+            self.set_status(f"⛔ 已取消: {filename}")
+            raise
         except Exception as e:
-            self.status_var.set(f"❌ 下载失败: {str(e)}")
-        finally:
-            self.downloading = False
+            self.set_status(f"❌ 下载失败: {str(e)}")
+            raise
+        with stage(job, "finalize"):
+            _, deduped = self.archive.record("twitter", video_id, fmt_id, path or final_path)
+        self.set_status(f"✅ 下载完成: {filename}" + ("（内容与已有文件相同，已硬链接）" if deduped else ""))
 
 if __name__ == "__main__":
     root = tk.Tk()
+    warm = warm_up(sites=("Twitter",))
     app = TwitterDownloaderApp(root)
+    track_startup(root, "twitter", STARTED, warm)
     root.mainloop()
@@ -1,16 +1,25 @@
-﻿import os
-import sys
+﻿import time
+STARTED = time.perf_counter()  # 启动计时起点，放在其他导入之前
+
+import os
 import re
 import json
-import shutil
-import threading
-import subprocess
 import tkinter as tk
-from tkinter import filedialog, scrolledtext, ttk, messagebox
-import pyperclip
-import yt_dlp
-import humanize
-from googletrans import Translator
+from tkinter import filedialog, ttk, messagebox
+from 翻译缓存 import TranslationService, BACKENDS
+from 解析缓存 import extract_info, resolve_formats, ParseBatch
+from 下载核心 import sanitize_filename, collect_formats, format_string, format_size, download_video
+from 大小探测 import size_prober
+from 转码工具 import check_ffmpeg, transcode_video, stream_transcode, plan_stream, speed_factor, job_hooks, TranscodePool, MODE_TEXT, FULL
+from 任务队列 import JobQueue, JobCancelled, TRANSCODING, DEFAULT_MAX_WORKERS
+from 任务列表 import JobListView, UiPump
+from 结果列表 import ResultListView
+from 带宽调度 import bandwidth
+from 剪贴板监听 import ClipboardWatcher, paste_urls
+from 下载存档 import DownloadArchive
+from 任务日志 import JobJournal, STAGE_DOWNLOADING, STAGE_DOWNLOADED, STAGE_TRANSCODING
+from 启动预热 import warm_up, track_startup
+from 任务指标 import metrics, stage
 
 CONFIG_FILE = "config.json"
 
@@ -19,13 +28,27 @@ def load_config():
     default_path = os.path.join(os.getcwd(), "")
     if not os.path.exists(default_path):
         os.makedirs(default_path)
-    config = {"download_path": default_path}
+    # stream_transcode: 边下载边转码，一个 ffmpeg 进程完成合并+编码
+    # translate_backend: google / offline（离线替身，原文返回）
+    # bandwidth_limit: 所有下载的总限速（字节/秒），0 为不限
+    config = {"download_path": default_path, "max_workers": DEFAULT_MAX_WORKERS, "watch_clipboard": False,
+              "stream_transcode": True, "translate_backend": "google", "bandwidth_limit": 0}
     if os.path.exists(CONFIG_FILE):
         try:
             with open(CONFIG_FILE, "r", encoding="utf-8") as f:
                 data = json.load(f)
                 if os.path.exists(data.get("download_path", "")):
                     config["download_path"] = data["download_path"]
+                if isinstance(data.get("max_workers"), int) and data["max_workers"] > 0:
+                    config["max_workers"] = data["max_workers"]
+                if isinstance(data.get("bandwidth_limit"), int) and data["bandwidth_limit"] >= 0:
+                    config["bandwidth_limit"] = data["bandwidth_limit"]
+                if isinstance(data.get("watch_clipboard"), bool):
+                    config["watch_clipboard"] = data["watch_clipboard"]
+                if isinstance(data.get("stream_transcode"), bool):
+                    config["stream_transcode"] = data["stream_transcode"]
+                if data.get("translate_backend") in BACKENDS:
+                    config["translate_backend"] = data["translate_backend"]
         except:
             pass
     return config
@@ -34,33 +57,8 @@ def save_config(config):
     with open(CONFIG_FILE, "w", encoding="utf-8") as f:
         json.dump(config, f)
 
-# ---------------- FFmpeg ----------------
-def get_ffmpeg_path():
-    if getattr(sys, 'frozen', False):
-        base_path = os.path.dirname(sys.executable)
-    else:
-        base_path = os.path.dirname(os.path.abspath(__file__))
-    target = os.path.join(base_path, "ffmpeg.exe")
-    return target if os.path.exists(target) else "ffmpeg"
-
-def check_ffmpeg():
-    return shutil.which("ffmpeg") is not None or os.path.exists(get_ffmpeg_path())
-
-def sanitize_filename(name):
-    name = re.sub(r'[\\/:*?"<>|]', '', name)
-    return name.strip()
-
-def transcode_video(input_path, output_path):
-    ffmpeg_path = get_ffmpeg_path()
-    startupinfo = subprocess.STARTUPINFO()
-    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-
-    cmd = [
-        ffmpeg_path, '-i', input_path,
-        '-c:v', 'libx264', '-pix_fmt', 'yuv420p',
-        '-c:a', 'aac', '-y', output_path
-    ]
-    subprocess.run(cmd, startupinfo=startupinfo, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+def output_name(translated_desc, video_id):
+    return sanitize_filename(translated_desc).replace("\n"," ")[:80] or f"twitter_{video_id}"
 
 # ---------------- 主程序 ----------------
 class TwitterDownloaderApp:
@@ -70,8 +68,14 @@ class TwitterDownloaderApp:
         root.geometry("400x750")
 
         self.config = load_config()
-        self.downloading = False
-        self.translator = Translator()
+        self.jobs = JobQueue(self.config["max_workers"])
+        bandwidth.set_limit(self.config["bandwidth_limit"])
+        self.transcoder = TranscodePool()
+        self.archive = DownloadArchive()
+        self.journal = JobJournal()
+        self.journal.watch(self.jobs)
+        metrics.watch(self.jobs)
+        self.translator = TranslationService(BACKENDS[self.config["translate_backend"]]())
         self.default_font = ("Microsoft YaHei", 10)
         self.top_state = True  # 默认置顶
         root.attributes("-topmost", self.top_state)
@@ -95,6 +99,11 @@ class TwitterDownloaderApp:
         tk.Button(frame_btn, text="📋 粘贴并解析", command=self.parse_clipboard_url, bg="#e1f5fe", font=(self.default_font[0], 10, "bold"), width=15).pack(side="left", padx=10)
         self.top_btn = tk.Button(frame_btn, text="📍 取消置顶", command=self.toggle_top, font=self.default_font)
         self.top_btn.pack(side="left", padx=10)
+        # 剪贴板监听：复制链接后立即在后台预解析
+        self.watch_var = tk.BooleanVar(value=self.config["watch_clipboard"])
+        tk.Checkbutton(frame_btn, text="👀 监听剪贴板", variable=self.watch_var, command=self.toggle_watch, font=self.default_font).pack(side="left")
+        self.watcher = ClipboardWatcher(root, on_found=self.on_clipboard_urls)
+        self.watcher.set_enabled(self.watch_var.get())
 
         # 状态与进度
         self.status_var = tk.StringVar(value="准备就绪")
@@ -102,15 +111,60 @@ class TwitterDownloaderApp:
         self.progress = ttk.Progressbar(root, orient="horizontal", length=350, mode="determinate")
         self.progress.pack(padx=10, pady=5)
 
+        self.ui = UiPump(root)
+        self.batch = None
+        self.job_view = JobListView(root, root, self.jobs, font=self.default_font,
+                                    on_workers_changed=self.set_max_workers,
+                                    on_limit_changed=self.set_bandwidth_limit,
+                                    pump=self.ui, progress=self.progress)
+        self.transcode_var = tk.StringVar()
+        tk.Label(root, textvariable=self.transcode_var, fg="#666666", font=self.default_font).pack()
+        self.update_transcode_stats()
+
         # 结果显示
-        tk.Label(root, text="解析结果：", anchor="w", font=self.default_font).pack(fill="x", padx=10, pady=(10,0))
-        self.result_box = scrolledtext.ScrolledText(root, width=80, height=20, font=self.default_font)
-        self.result_box.pack(padx=10, pady=5, fill="both", expand=True)
+        self.results = ResultListView(root, root, lambda args: self.start_download(*args),
+                                      font=self.default_font, height=20)
 
         # FFmpeg 提示
         if not check_ffmpeg():
             tk.Label(root, text="⚠️ 未检测到 FFmpeg，可能无法转码！", fg="red", font=self.default_font).pack(pady=2)
 
+        self.resume_jobs()
+
+    def resume_jobs(self):
+        # 上次退出（或崩溃）时没完成的任务重新排队
+        entries = self.journal.pending("twitter_transcode")
+        for entry in entries:
+            self.start_download(*entry["args"], entry_id=entry["id"])
+        if entries:
+            self.status_var.set(f"♻️ 已恢复 {len(entries)} 个未完成的任务")
+
+    def update_transcode_stats(self):
+        st = self.transcoder.stats()
+        self.transcode_var.set(f"🎞️ 转码: 排队 {st['queued']} | 进行中 {st['active']}/{st['workers']}"
+                               f" | 每路 {st['threads_per_job']} 线程 | 利用率 {st['utilization']:.0%}")
+        self.root.after(1000, self.update_transcode_stats)
+
+    def set_status(self, text):
+        # 工作线程里改状态栏：交给主线程统一刷新
+        self.ui.post("status", self.status_var.set, text)
+
+    def toggle_watch(self):
+        self.watcher.set_enabled(self.watch_var.get())
+        self.config["watch_clipboard"] = self.watch_var.get()
+        save_config(self.config)
+
+    def on_clipboard_urls(self, urls):
+        self.status_var.set(f"🔎 剪贴板发现 {len(urls)} 个新链接，后台预解析中...")
+
+    def set_max_workers(self, n):
+        self.config["max_workers"] = n
+        save_config(self.config)
+
+    def set_bandwidth_limit(self, limit):
+        self.config["bandwidth_limit"] = limit
+        save_config(self.config)
+
     def toggle_top(self):
         self.top_state = not self.top_state
         self.root.attributes("-topmost", self.top_state)
@@ -124,129 +178,199 @@ class TwitterDownloaderApp:
             save_config(self.config)
 
     def parse_clipboard_url(self):
-        try:
-            url = pyperclip.paste().strip()
-        except:
-            url = ""
-        if not url or "http" not in url:
+        # 剪贴板里可以有多个链接：并发解析，哪个先解析完先显示哪个
+        urls = paste_urls()
+        if not urls:
             self.status_var.set("❌ 剪贴板没有有效链接")
             return
-        self.url_var.set(url)
-        self.status_var.set("⏳ 正在解析视频...")
-        self.result_box.delete("1.0", tk.END)
-        threading.Thread(target=self.analyze, args=(url,), daemon=True).start()
+        self.url_var.set(" ".join(urls))
+        self.status_var.set("⏳ 正在解析视频..." if len(urls) == 1 else f"⏳ 正在解析 {len(urls)} 个链接...")
+        self.results.clear()
+        if self.batch:
+            self.batch.cancel()
+        self.batch = ParseBatch(urls, self.on_parsed, extract=self.extract).start()
+
+    def extract(self, url):
+        with metrics.timed("extract", url=url):
+            return extract_info(url)
+
+    def on_parsed(self, batch, url, info, error):
+        # 解析线程里回调，切回主线程显示
+        self.ui.post(("parsed", batch, url), self.show_result, batch, url, info, error)
+
+    def show_result(self, batch, url, info, error):
+        # 主线程里显示一条解析结果
+        if batch is not self.batch:
+            return
+        if batch.total > 1:
+            self.status_var.set(f"⏳ {batch.progress_text()}" if batch.done < batch.total
+                                else f"✅ {batch.progress_text()}")
+        if error is not None:
+            if batch.total == 1:
+                self.status_var.set("❌ 解析出错")
+            self.results.add_error(url, str(error))
+        elif info is not None:
+            self.show_formats(url, info, batch.total == 1)
 
     def translate_text(self, text):
-        try:
-            translated = self.translator.translate(text, dest='zh-cn')
-            return translated.text
-        except:
-            return text
+        return self.translator.translate(text, dest='zh-cn')
 
-    def analyze(self, url):
+    def show_formats(self, url, info, single=True):
         try:
-            ydl_opts = {"quiet": True, "no_warnings": True}
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                title = info.get("title", "twitter_video")
-                video_id = info.get("id", "")
-                description = info.get("description", "")
-                description = re.sub(r'^@\S+\s*', '', description)
-                translated_desc = self.translate_text(description)
-                self.result_box.insert(tk.END, f"标题: {title}\n正文翻译: {translated_desc}\n{'-'*50}\n")
-
-                # 收集所有 MP4 视频版本
-                formats = info.get("formats", [])
-                valid_formats = []
-                for f in formats:
-                    if f.get("vcodec") != 'none' and f.get("ext") == "mp4":
-                        filesize = f.get("filesize") or f.get("filesize_approx") or 0
-                        valid_formats.append({
-                            "id": f["format_id"],
-                            "res": f.get("resolution") or f"{f.get('width')}x{f.get('height')}",
-                            "size_bytes": filesize,
-                            "size_str": humanize.naturalsize(filesize) if filesize>0 else "未知大小",
-                            "tbr": f.get("tbr") or 0
-                        })
-
-                if not valid_formats:
+            title = info.get("title", "twitter_video")
+            video_id = info.get("id", "")
+            description = info.get("description", "")
+            description = re.sub(r'^@\S+\s*', '', description)
+            # 翻译放到后台，格式先列出来，译文回来后填进“说明”栏
+            item = self.results.add_item(title, url, "⏳ 翻译中...")
+            self.translator.submit(description, dest='zh-cn').add_done_callback(
+                lambda fut: self.ui.post(("info", item), self.results.set_info, item, fut.result()))
+
+            # 收集所有 MP4 视频版本
+            valid_formats = collect_formats(info)
+            if not valid_formats:
+                if single:
                     self.status_var.set("❌ 未找到可用视频")
-                    return
+                self.results.add_error(url, "未找到可用视频")
+                return
 
-                # 按分辨率排序，显示每个版本下载按钮
-                valid_formats = sorted(valid_formats, key=lambda x: x["tbr"], reverse=True)
+            # 按码率排序，每个版本一行
+            valid_formats = sorted(valid_formats, key=lambda x: x["tbr"], reverse=True)
+            if single:
                 self.status_var.set("✅ 解析成功")
 
-                for f in valid_formats:
-                    btn_text = f"下载 {f['res']} ({f['size_str']})"
-                    info_text = f"📺 分辨率: {f['res']} | 大小: {f['size_str']}  "
-                    self.result_box.insert(tk.END, info_text)
-                    btn = tk.Button(self.result_box, text=btn_text, cursor="hand2", bg="#f0f0f0",
-                                    font=self.default_font,
-                                    command=lambda fid=f['id'], u=url, t=title, desc=translated_desc, vid=video_id:
-                                    self.start_download(fid, u, t, desc, vid))
-                    self.result_box.window_create(tk.END, window=btn)
-                    self.result_box.insert(tk.END, "\n\n")
+            rows = {}
+            for f in valid_formats:
+                rows[f['id']] = self.results.add_format(item, (f['id'], url, title, description, video_id), f['res'],
+                                                        f['size_str'], f['height'], f['size_bytes'])
 
-        except Exception as e:
-            self.status_var.set("❌ 解析出错")
-            self.result_box.insert(tk.END, str(e))
+            # 列表先出来，没有大小的格式在后台并发探测，探到一个填一个
+            size_prober.fill(info, valid_formats, lambda fid, size, approx:
+                             self.ui.post(("size", rows[fid]), self.results.set_size, rows[fid],
+                                          format_size(size, approx), size))
 
-    def start_download(self, fmt_id, url, title, translated_desc, video_id):
-        if self.downloading:
-            self.status_var.set("❌ 已有任务在下载")
+        except Exception as e:
+            self.set_status("❌ 解析出错")
+            self.results.add_error(url, str(e))
+
+    def start_download(self, fmt_id, url, title, description, video_id, entry_id=None):
+        # 译文还没回来时先用推文 id 占位，真正的文件名在任务开始时确定
+        future = self.translator.submit(description, dest='zh-cn')
+        safe_text = output_name(future.result(), video_id) if future.done() else f"twitter_{video_id}"
+        if entry_id is None:
+            entry_id = self.journal.add("twitter_transcode", f"{url}#{fmt_id}",
+                                        [fmt_id, url, title, description, video_id])
+        if self.journal.is_live(entry_id):
+            self.status_var.set(f"⏳ 已在下载队列中: {safe_text}.mp4")
+            return
+        job = self.jobs.submit(self.download_and_transcode, url, fmt_id, title, description, video_id, entry_id,
+                               name=f"{safe_text}.mp4")
+        self.journal.bind(entry_id, job)
+        self.status_var.set(f"➕ 已加入下载队列: {safe_text}.mp4")
+
+    def download_and_transcode(self, job, url, fmt_id, title, description, video_id, entry_id):
+        job.journal_id = entry_id
+        # 存档里按“格式+h264”记录转码后的成品，与普通下载版的原始文件区分开
+        archive_key = ("twitter", video_id, f"{fmt_id}+h264")
+        existing = self.archive.lookup(*archive_key)
+        if existing:
+            self.set_status(f"✅ 已下载过，跳过: {os.path.basename(existing)}")
             return
-        threading.Thread(target=self.download_and_transcode, args=(url, fmt_id, title, translated_desc, video_id), daemon=True).start()
-
-    def download_and_transcode(self, url, fmt_id, title, translated_desc, video_id):
-        self.downloading = True
-        save_path = self.path_var.get()
-        safe_text = sanitize_filename(translated_desc).replace("\n"," ")[:80] or f"twitter_{video_id}"
-        tmp_file = os.path.join(save_path, f"{safe_text}_tmp.mp4")
-        final_file = os.path.join(save_path, f"{safe_text}.mp4")
-
-        self.progress['value'] = 0
-        self.status_var.set(f"⬇️ 下载中: {safe_text}.mp4")
 
-        def progress_hook(d):
-            if d['status'] == 'downloading':
+        # 恢复的任务沿用上次的文件名：下载中断的接着 .part 续传，已下载完的只重做转码
+        entry = self.journal.get(entry_id)
+        final_file = entry["final_path"]
+        if not final_file:
+            with stage(job, "translate"):
+                safe_text = output_name(self.translate_text(description), video_id)
+            final_file = self.archive.allocate_path(self.path_var.get(), safe_text, "mp4")
+        tmp_file = final_file[:-len(".mp4")] + "_tmp.mp4"
+        job.name = os.path.basename(final_file)
+        if entry["stage"] in (STAGE_DOWNLOADED, STAGE_TRANSCODING) and os.path.exists(tmp_file):
+            job.update(state=TRANSCODING, message="等待转码")
+            return self.transcoder.submit(self.transcode_task, job, tmp_file, final_file, archive_key)
+        self.journal.update(entry_id, STAGE_DOWNLOADING, final_path=final_file, tmp_path=tmp_file)
+
+        fmt_str = format_string(fmt_id, check_ffmpeg())
+        if self.config["stream_transcode"] and check_ffmpeg():
+            try:
+                formats = resolve_formats(url, fmt_str)
+                plan = plan_stream(formats)
+            except Exception as e:
+                formats = None
+                self.set_status(f"⚠️ 无法直连视频流，改为先下载后转码: {str(e)[:50]}")
+            if formats:
                 try:
-                    p = d.get('_percent_str','0%').replace('%','')
-                    self.progress['value'] = float(p)
-                    self.status_var.set(f"⬇️ 下载中 {d.get('_percent_str')} | 速度: {d.get('_speed_str')}")
-                except: pass
-            elif d['status'] == 'finished':
-                self.progress['value'] = 100
-                self.status_var.set("⬇️ 下载完成，开始转码...")
-
-        fmt_str = f"{fmt_id}+bestaudio/best" if check_ffmpeg() else f"{fmt_id}/best"
-        ydl_opts = {
-            "format": fmt_str,
-            "outtmpl": tmp_file,
-            "progress_hooks": [progress_hook],
-            "quiet": True,
-            "no_warnings": True,
-        }
+                    if plan[0] == FULL:
+                        # 要重新编码：边下边转同时占着下载槽位和转码池的编码槽位
+                        job.update(state=TRANSCODING, progress=0, message="等待转码")
+                        self.transcoder.run(job, self.stream_task, job, formats, plan, final_file, archive_key)
+                    else:
+                        # 只换封装 / 只转音频几乎不占 CPU，就在下载槽位里做完
+                        self.stream_task(job, formats, plan, final_file, archive_key)
+                    return
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    # 直连流失败（如 ffmpeg 不支持该协议）时退回先下载后转码
+                    job.checkpoint()
+                    self.set_status(f"⚠️ 边下边转失败，改为先下载后转码: {str(e)[:50]}")
+
+        self.download_file(job, url, fmt_str, tmp_file)
+        job.update(state=TRANSCODING, message="等待转码")
+        self.set_status(f"⬇️ 下载完成，等待转码: {job.name}")
+        return self.transcoder.submit(self.transcode_task, job, tmp_file, final_file, archive_key)
+
+    def download_file(self, job, url, fmt_str, tmp_file):
+        filename = os.path.basename(tmp_file)
+        self.set_status(f"⬇️ 下载中: {filename}")
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
+            download_video(job, url, fmt_str, tmp_file)
+            self.journal.update(job.journal_id, STAGE_DOWNLOADED)
+        except JobCancelled:
+            self.set_status(f"⛔ 已取消: {filename}")
+            raise
         except Exception as e:
-            self.status_var.set(f"❌ 下载失败: {str(e)}")
-            self.downloading = False
-            return
-
-        # 转码
+            self.set_status(f"❌ 下载失败: {str(e)}")
+            raise
+
+    # 完整转码时在转码池线程中执行，只换封装 / 只转音频时在下载线程中执行
+    def stream_task(self, job, formats, plan, final_file, archive_key, threads=None):
+        job.checkpoint()
+        job.update(state=TRANSCODING, message="")
+        self.set_status(f"🎞️ 边下载边转码: {os.path.basename(final_file)}")
+        with stage(job, "transcode", method="stream") as timing:
+            mode, reason = stream_transcode(formats, final_file, threads=threads, plan=plan, **job_hooks(job))
+            timing.update(encoder=mode, speed_factor=speed_factor(final_file, job.metrics.elapsed(timing)))
+        with stage(job, "finalize"):
+            self.archive.record(*archive_key, final_file)
+        self.set_status(f"✅ 下载并转码完成 ({MODE_TEXT[mode]}: {reason}): {final_file}")
+
+    # 在转码池线程中执行
+    def transcode_task(self, job, tmp_file, final_file, archive_key, threads=None):
+        job.checkpoint()
+        job.update(state=TRANSCODING, message="")
+        self.journal.update(job.journal_id, STAGE_TRANSCODING)
+        self.set_status("🎞️ 开始转码...")
         try:
-            transcode_video(tmp_file, final_file)
-            os.remove(tmp_file)
-            self.status_var.set(f"✅ 下载并转码完成: {final_file}")
+            with stage(job, "transcode", method="file") as timing:
+                mode, reason = transcode_video(tmp_file, final_file, threads=threads, **job_hooks(job))
+                timing.update(encoder=mode, speed_factor=speed_factor(final_file, job.metrics.elapsed(timing)))
+            with stage(job, "finalize"):
+                os.remove(tmp_file)
+                self.archive.record(*archive_key, final_file)
+            self.set_status(f"✅ 下载并转码完成 ({MODE_TEXT[mode]}: {reason}): {final_file}")
+        except JobCancelled:
+            self.set_status(f"⛔ 已取消转码: {os.path.basename(final_file)}")
+            raise
         except Exception as e:
-            self.status_var.set(f"❌ 转码失败: {str(e)}")
-
-        self.downloading = False
+            self.set_status(f"❌ 转码失败: {str(e)}")
+            raise
 
 if __name__ == "__main__":
     root = tk.Tk()
+    warm = warm_up(sites=("Twitter",))
     app = TwitterDownloaderApp(root)
+    track_startup(root, "twitter_transcode", STARTED, warm)
     root.mainloop()
@@ -0,0 +1,148 @@
+﻿import tkinter as tk
+from tkinter import ttk
+
+FILTER_DELAY_MS = 200   # 筛选框停止输入多久后才刷新
+
+
+# --------------------
+# 解析结果列表：每个链接一行，展开是它的各个版本；双击版本行、回车或“下载选中”开始下载。
+# 不再往文本框里嵌按钮，行数再多也只是 Treeview 里的几条记录；点表头排序，筛选框按标题 / 链接 / 分辨率过滤
+# --------------------
+class ResultListView:
+    def __init__(self, root, parent, on_download, font=None, height=10, title="解析结果（双击或回车下载）"):
+        self.root = root
+        self.on_download = on_download
+        self._items = []      # 顶层行（按加入顺序），筛选后按这个顺序放回
+        self._search = {}     # 顶层行 -> 用来筛选的小写文本
+        self._rows = {}       # 版本行 -> (下载参数, 高度, 字节数)
+        self._sort_reverse = {}
+        self._filter_job = None
+
+        frame = tk.LabelFrame(parent, text=f"🔎 {title}", padx=5, pady=5, font=font)
+        frame.pack(fill="both", expand=True, padx=10, pady=5)
+
+        frame_bar = tk.Frame(frame)
+        frame_bar.pack(fill="x", pady=(0, 5))
+        tk.Label(frame_bar, text="筛选:", font=font).pack(side="left")
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add("write", lambda *_: self._schedule_filter())
+        tk.Entry(frame_bar, textvariable=self.filter_var, font=font).pack(side="left", fill="x", expand=True, padx=5)
+        tk.Button(frame_bar, text="⬇️ 下载选中", command=self.download_selected, font=font).pack(side="left")
+
+        frame_tree = tk.Frame(frame)
+        frame_tree.pack(fill="both", expand=True)
+        self.tree = ttk.Treeview(frame_tree, columns=("res", "size", "info"), height=height)
+        self.tree.heading("#0", text="标题 / 版本", command=lambda: self.sort("#0"))
+        self.tree.heading("res", text="分辨率", command=lambda: self.sort("res"))
+        self.tree.heading("size", text="大小", command=lambda: self.sort("size"))
+        self.tree.heading("info", text="说明")
+        self.tree.column("#0", width=220)
+        self.tree.column("res", width=90, anchor="center")
+        self.tree.column("size", width=90, anchor="e")
+        self.tree.column("info", width=160)
+        self.tree.tag_configure("error", foreground="#d32f2f")
+        scroll = ttk.Scrollbar(frame_tree, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scroll.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        scroll.pack(side="right", fill="y")
+
+        self.tree.bind("<Double-1>", self._on_double_click)
+        self.tree.bind("<Return>", lambda e: self.download_selected())
+
+    def clear(self):
+        # 被筛掉（detach）的行不在 get_children 里，按自己的记录删
+        self.tree.delete(*[iid for iid in self._items if self.tree.exists(iid)])
+        self._items.clear()
+        self._search.clear()
+        self._rows.clear()
+
+    def add_item(self, title, url="", info=""):
+        # 一个解析出来的视频 / 笔记，返回行 id，版本行挂在它下面
+        iid = self.tree.insert("", tk.END, text=title, values=("", "", info), open=True)
+        self._items.append(iid)
+        self._search[iid] = f"{title} {url}".lower()
+        if not self._matches(iid):
+            self.tree.detach(iid)
+        return iid
+
+    def add_error(self, url, message):
+        iid = self.tree.insert("", tk.END, text=f"❌ {url}", values=("", "", message), tags=("error",))
+        self._items.append(iid)
+        self._search[iid] = f"{url} {message}".lower()
+        if not self._matches(iid):
+            self.tree.detach(iid)
+        return iid
+
+    def add_format(self, item, args, res, size_text, height=0, size=0, info=""):
+        # 双击这一行时调用 on_download(args)
+        iid = self.tree.insert(item, tk.END, text=f"下载 {res}", values=(res, size_text, info))
+        self._rows[iid] = (args, height, size or 0)
+        self._search[item] += f" {res}".lower()
+        return iid
+
+    def set_size(self, iid, text, size=None):
+        # 后台探测到大小后刷新；行已被新的解析清掉时忽略
+        if iid not in self._rows:
+            return
+        self.tree.set(iid, "size", text)
+        if size is not None:
+            args, height, _ = self._rows[iid]
+            self._rows[iid] = (args, height, size)
+
+    def set_info(self, iid, text):
+        if iid in self._search:
+            self.tree.set(iid, "info", text)
+
+    def download_selected(self):
+        # 选中的是视频 / 笔记那一行时，下载它的第一个版本
+        for iid in self.tree.selection():
+            if iid not in self._rows:
+                children = self.tree.get_children(iid)
+                iid = children[0] if children else None
+            if iid in self._rows:
+                self.on_download(self._rows[iid][0])
+
+    def _on_double_click(self, event):
+        # 双击顶层行只展开 / 收起，双击版本行才下载
+        iid = self.tree.identify_row(event.y)
+        if iid in self._rows:
+            self.on_download(self._rows[iid][0])
+
+    def sort(self, column):
+        reverse = self._sort_reverse[column] = not self._sort_reverse.get(column, column == "#0")
+        for item in self._items:
+            children = sorted(self.tree.get_children(item), key=lambda iid: self._sort_key(iid, column),
+                              reverse=reverse)
+            for index, iid in enumerate(children):
+                self.tree.move(iid, item, index)
+        if column == "#0":
+            self._items.sort(key=lambda iid: self.tree.item(iid, "text").lower(), reverse=reverse)
+            self._apply_filter()
+
+    def _sort_key(self, iid, column):
+        _, height, size = self._rows[iid]
+        if column == "res":
+            return height
+        if column == "size":
+            return size
+        return self.tree.item(iid, "text")
+
+    def _matches(self, iid):
+        text = self.filter_var.get().strip().lower()
+        return not text or text in self._search[iid]
+
+    def _schedule_filter(self):
+        if self._filter_job is not None:
+            self.root.after_cancel(self._filter_job)
+        self._filter_job = self.root.after(FILTER_DELAY_MS, self._apply_filter)
+
+    def _apply_filter(self):
+        # 不匹配的 detach（行还在，只是不显示），匹配的按原顺序放回
+        self._filter_job = None
+        index = 0
+        for iid in self._items:
+            if self._matches(iid):
+                self.tree.move(iid, "", index)
+                index += 1
+            else:
+                self.tree.detach(iid)
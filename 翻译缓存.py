@@ -0,0 +1,128 @@
+﻿import hashlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+CACHE_FILE = "translations.db"
+DEFAULT_DEST = "zh-cn"
+
+
+# --------------------
+# 翻译后端
+# --------------------
+class GoogleBackend:
+    # googletrans 较重，第一次真正翻译时才导入
+    def __init__(self):
+        self._translator = None
+
+    def translate_batch(self, texts, dest):
+        if self._translator is None:
+            from googletrans import Translator
+            self._translator = Translator()
+        results = self._translator.translate(list(texts), dest=dest)
+        return [r.text for r in results]
+
+
+class OfflineBackend:
+    # 离线替身：原文返回，用于测试或没有网络的机器
+    def translate_batch(self, texts, dest):
+        return list(texts)
+
+
+BACKENDS = {"google": GoogleBackend, "offline": OfflineBackend}
+
+
+# --------------------
+# 磁盘缓存（SQLite）
+# --------------------
+def _key(text, dest):
+    return hashlib.sha1(f"{dest}\0{text}".encode("utf-8")).hexdigest()
+
+
+class TranslationCache:
+    def __init__(self, path=CACHE_FILE):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS translations "
+                         "(key TEXT PRIMARY KEY, dest TEXT, text TEXT, created REAL)")
+        self._db.commit()
+
+    def get(self, text, dest):
+        with self._lock:
+            row = self._db.execute("SELECT text FROM translations WHERE key = ?", (_key(text, dest),)).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, pairs, dest):
+        now = time.time()
+        rows = [(_key(src, dest), dest, translated, now) for src, translated in pairs]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)", rows)
+            self._db.commit()
+
+
+# --------------------
+# 异步批量翻译
+# --------------------
+class TranslationService:
+    def __init__(self, backend=None, cache=None, batch_delay=0.2, max_batch=16):
+        self.backend = backend or GoogleBackend()
+        self.cache = cache or TranslationCache()
+        self.batch_delay = batch_delay
+        self.max_batch = max_batch
+        self._pending = []          # [(text, dest, future)]
+        self._inflight = {}         # (text, dest) -> future，相同原文只翻译一次
+        self._cond = threading.Condition()
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, text, dest=DEFAULT_DEST):
+        # 返回 Future，结果为译文；翻译失败时结果为原文（不写缓存，下次重试）
+        future = Future()
+        if not text:
+            future.set_result(text)
+            return future
+        cached = self.cache.get(text, dest)
+        if cached is not None:
+            future.set_result(cached)
+            return future
+        with self._cond:
+            if (text, dest) in self._inflight:
+                return self._inflight[(text, dest)]
+            self._inflight[(text, dest)] = future
+            self._pending.append((text, dest, future))
+            self._cond.notify()
+        return future
+
+    def translate(self, text, dest=DEFAULT_DEST, timeout=None):
+        try:
+            return self.submit(text, dest).result(timeout)
+        except Exception:
+            return text
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+        # 稍等片刻，把同一时间段内的请求攒成一批
+        time.sleep(self.batch_delay)
+        with self._cond:
+            dest = self._pending[0][1]
+            batch = [item for item in self._pending if item[1] == dest][:self.max_batch]
+            for item in batch:
+                self._pending.remove(item)
+        return dest, batch
+
+    def _worker(self):
+        while True:
+            dest, batch = self._take_batch()
+            texts = [text for text, _, _ in batch]
+            try:
+                results = self.backend.translate_batch(texts, dest)
+                self.cache.put_many(zip(texts, results), dest)
+            except Exception:
+                results = texts
+            with self._cond:
+                for text, _, _ in batch:
+                    self._inflight.pop((text, dest), None)
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,284 @@
+﻿import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+
+# --------------------
+# 解析结果缓存（LRU + TTL）
+# --------------------
+DEFAULT_TTL = 600           # 秒，解析结果最长保留时间
+DEFAULT_MAX_ENTRIES = 128
+PARSE_WORKERS = 16          # 批量粘贴时同时解析的链接数
+EXPIRY_MARGIN = 60          # 签名链接到期前多少秒就视为失效
+MAX_REDIRECTS = 5           # 短链等跳转类解析结果最多跟几层
+
+_ID_PATTERNS = [
+    ("twitter", re.compile(r"^twitter\.com/(?:[^/]+|i/web|i)/status(?:es)?/(\d+)")),
+    ("xiaohongshu", re.compile(r"^xiaohongshu\.com/(?:explore|discovery/item|user/profile/[^/]+)/([0-9a-fA-F]+)")),
+]
+
+# 常见 CDN 签名链接里表示过期时间戳的参数名
+_EXPIRY_PARAMS = ("expires", "expire", "x-expires", "x-oss-expires", "deadline")
+
+
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    for prefix in ("www.", "mobile.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    if host == "x.com":
+        host = "twitter.com"
+    return f"{host}{parts.path.rstrip('/')}"
+
+
+def cache_keys(url):
+    # 能从链接里认出推文/笔记 id 时优先用 "站点:id"，否则退回规范化后的链接
+    norm = normalize_url(url)
+    keys = []
+    for site, pattern in _ID_PATTERNS:
+        m = pattern.search(norm)
+        if m:
+            keys.append(f"{site}:{m.group(1)}")
+    keys.append(norm)
+    return keys
+
+
+def video_key(url):
+    # 能直接从链接认出的 (站点, id)，认不出（如短链）返回 None
+    key = cache_keys(url)[0]
+    if ":" in key and "/" not in key:
+        return tuple(key.split(":", 1))
+    return None
+
+
+def _info_keys(info):
+    keys = []
+    if info.get("extractor_key") and info.get("id"):
+        keys.append(f"{info['extractor_key'].lower()}:{info['id']}")
+    if info.get("webpage_url"):
+        keys.extend(cache_keys(info["webpage_url"]))
+    return keys
+
+
+def media_expiry(info):
+    # 取所有格式链接中最早的签名过期时间，没有签名参数则返回 None
+    earliest = None
+    for f in info.get("formats") or [info]:
+        url = f.get("url") or ""
+        for key, value in parse_qsl(urlsplit(url).query):
+            if key.lower() in _EXPIRY_PARAMS and value.isdigit():
+                ts = int(value)
+                if ts > 10 ** 12:  # 毫秒时间戳
+                    ts //= 1000
+                earliest = ts if earliest is None else min(earliest, ts)
+    return earliest
+
+
+class ExtractCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> [info, expires_at]，同一条目可挂多个 key
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        now = time.time()
+        with self._lock:
+            for key in cache_keys(url):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[1] <= now:
+                    self._drop(entry)
+                    return None
+                self._entries.move_to_end(key)
+                return entry[0]
+        return None
+
+    def put(self, url, info):
+        expires_at = time.time() + self.ttl
+        signed = media_expiry(info)
+        if signed is not None:
+            expires_at = min(expires_at, signed - EXPIRY_MARGIN)
+        entry = [info, expires_at]
+        with self._lock:
+            for key in cache_keys(url) + _info_keys(info):
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, url):
+        with self._lock:
+            for key in cache_keys(url):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._drop(entry)
+
+    def _drop(self, entry):
+        for key in [k for k, v in self._entries.items() if v is entry]:
+            del self._entries[key]
+
+
+extract_cache = ExtractCache()
+
+# 正在解析中的链接：同一个视频同时只解析一次，后来的调用等前一个的结果
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _process(ydl, url, download=False):
+    # 等同 ydl.extract_info(url, download=download)，只是在 yt-dlp 按清晰度重排 thumbnails 之前
+    # 给每项记下原来的位置（original_index）：小红书图文笔记的图片只在 thumbnails 里，原顺序就是笔记里的顺序
+    info = ydl.extract_info(url, download=False, process=False)
+    for _ in range(MAX_REDIRECTS):
+        if info.get("_type") != "url":
+            break
+        info = ydl.extract_info(info["url"], download=False, process=False, ie_key=info.get("ie_key"))
+    for index, thumb in enumerate(info.get("thumbnails") or []):
+        thumb.setdefault("original_index", index)
+    return ydl.process_ie_result(info, download=download)
+
+
+def _extract(url, ydl_opts):
+    if ydl_opts is None:
+        # 默认参数走会话池，复用同站点已建好的 YoutubeDL（连接、cookie、游客令牌）
+        from 会话池 import sessions
+        with sessions.session(url) as ydl:
+            return _process(ydl, url)
+    import yt_dlp  # 启动时不导入 yt-dlp（较重），第一次用到时再导入，通常已被后台预热
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        return _process(ydl, url)
+
+
+def extract_info(url, ydl_opts=None, cache=extract_cache):
+    info = cache.get(url)
+    if info is not None:
+        return info
+    key = cache_keys(url)[0]
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+    if not owner:
+        return future.result()
+    try:
+        # 限流、网络错误按站点退避重试，站点熔断时在这里等
+        from 重试熔断 import resilience
+        info = resilience.call(url, _extract, url, ydl_opts)
+        cache.put(url, info)
+        future.set_result(info)
+        return info
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+# --------------------
+# 批量解析：一次粘贴多个链接时并发解析，每个解析完就回调，不等全部结束
+# --------------------
+parse_executor = ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="parse")
+
+
+class ParseBatch:
+    def __init__(self, urls, on_result, extract=extract_info, executor=None):
+        # on_result(batch, url, info, error) 在解析线程里调用；同一视频的不同链接（短链、x.com 等）
+        # 只有第一个带解析结果，其余的 info 和 error 都是 None，只用来刷新进度
+        self.urls = urls
+        self.on_result = on_result
+        self.extract = extract
+        self.executor = executor or parse_executor
+        self.total = len(urls)
+        self.done = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.cancelled = False
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        for url in self.urls:
+            self.executor.submit(self._run, url)
+        return self
+
+    def cancel(self):
+        # 新的一次粘贴开始后，旧批次还没回来的结果直接丢掉
+        self.cancelled = True
+
+    def _run(self, url):
+        if self.cancelled:
+            return
+        info = error = None
+        try:
+            info = self.extract(url)
+        except Exception as e:
+            error = e
+        with self._lock:
+            self.done += 1
+            if error is not None:
+                self.failed += 1
+            else:
+                keys = _info_keys(info)
+                if keys and keys[0] in self._seen:
+                    self.duplicates += 1
+                    info = None
+                else:
+                    self._seen.update(keys)
+        if not self.cancelled:
+            self.on_result(self, url, info, error)
+
+    def progress_text(self):
+        text = f"已解析 {self.done}/{self.total} 个链接"
+        if self.failed:
+            text += f"，失败 {self.failed} 个"
+        if self.duplicates:
+            text += f"，重复 {self.duplicates} 个"
+        return text
+
+
+def is_pending(url):
+    return cache_keys(url)[0] in _inflight
+
+
+def _is_expired_error(e):
+    text = str(e)
+    return any(code in text for code in ("HTTP Error 403", "HTTP Error 410", "HTTP Error 404"))
+
+
+def download_with_cache(ydl, url, cache=extract_cache):
+    # 有未过期的解析结果就直接交给 yt-dlp 下载，省掉第二次解析；签名链接失效时再重新解析
+    import yt_dlp
+    info = cache.get(url)
+    if info is not None and info.get("_type", "video") == "video":
+        try:
+            ydl.process_ie_result(ydl.sanitize_info(info, remove_private_keys=True), download=True)
+            return
+        except yt_dlp.utils.DownloadError as e:
+            if not _is_expired_error(e):
+                raise
+            cache.invalidate(url)
+    info = _process(ydl, url, download=True)
+    if info is not None and info.get("_type", "video") == "video":
+        cache.put(url, ydl.sanitize_info(info, remove_private_keys=True))
+
+
+def resolve_formats(url, fmt_str, cache=extract_cache):
+    # 按格式表达式从缓存的解析结果里选出实际要下载的流（视频+音频时返回两项）
+    info = extract_info(url, cache=cache)
+    if info.get("_type", "video") != "video":
+        raise ValueError("多视频内容不支持直接选流")
+    import yt_dlp
+    with yt_dlp.YoutubeDL({"format": fmt_str, "quiet": True, "no_warnings": True}) as ydl:
+        selected = ydl.process_ie_result(ydl.sanitize_info(info, remove_private_keys=True), download=False)
+    formats = selected.get("requested_formats") or [selected]
+    # 单个格式里一般没有时长，带上整条视频的时长，转码时用来算进度
+    for f in formats:
+        f.setdefault("duration", selected.get("duration"))
+    return formats
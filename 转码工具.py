@@ -0,0 +1,533 @@
+﻿import os
+import re
+import sys
+import json
+import time
+import shutil
+import tempfile
+import logging
+import functools
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION, TimeoutError as FutureTimeout
+
+from 任务队列 import JobCancelled
+
+logger = logging.getLogger(__name__)
+
+# ---------------- FFmpeg ----------------
+# 路径探测结果在进程内缓存，每个任务都会调用
+@functools.lru_cache(maxsize=None)
+def get_ffmpeg_path():
+    if getattr(sys, 'frozen', False):
+        base_path = os.path.dirname(sys.executable)
+    else:
+        base_path = os.path.dirname(os.path.abspath(__file__))
+    target = os.path.join(base_path, "ffmpeg.exe")
+    return target if os.path.exists(target) else "ffmpeg"
+
+def get_ffprobe_path():
+    ffmpeg_path = get_ffmpeg_path()
+    target = os.path.join(os.path.dirname(ffmpeg_path), "ffprobe.exe")
+    return target if os.path.exists(target) else "ffprobe"
+
+@functools.lru_cache(maxsize=None)
+def has_ffprobe():
+    # 说明里只让放 ffmpeg.exe：没有 ffprobe 时探测改用 ffmpeg -i 的输出
+    found = os.path.exists(get_ffprobe_path()) or shutil.which(get_ffprobe_path()) is not None
+    if not found:
+        logger.warning("未找到 ffprobe，改用 ffmpeg -i 的输出判断编码")
+    return found
+
+@functools.lru_cache(maxsize=None)
+def check_ffmpeg():
+    return shutil.which("ffmpeg") is not None or os.path.exists(get_ffmpeg_path())
+
+# 统一的输出编码参数：H.264 + AAC，保证各播放器都能直接打开
+ENCODE_ARGS = ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-c:a', 'aac']
+
+ERROR_TAIL_LINES = 20      # 只保留 ffmpeg 最后这么多行输出，出错时取末尾几行报错
+ERROR_TAIL_SHOWN = 5
+WATCH_INTERVAL = 0.2       # 秒，检查取消 / 超时的间隔
+
+def _popen_kwargs():
+    # Windows 下不弹出控制台窗口；其他系统不需要（STARTUPINFO 只在 Windows 上有）
+    if os.name != "nt":
+        return {}
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return {"startupinfo": startupinfo}
+
+def _parse_progress(block, duration):
+    # -progress 输出的一组 key=value，整理成 已处理秒数 / fps / 倍速 / 百分比 / 剩余秒数
+    try:
+        seconds = int(block.get("out_time_us") or block.get("out_time_ms") or 0) / 1e6
+    except ValueError:
+        seconds = 0.0
+    try:
+        speed = float(block.get("speed", "").rstrip("x"))
+    except ValueError:
+        speed = None
+    try:
+        fps = float(block.get("fps", ""))
+    except ValueError:
+        fps = None
+    progress = {"seconds": max(seconds, 0.0), "fps": fps, "speed": speed, "percent": None, "eta": None,
+                "done": block.get("progress") == "end"}
+    if duration:
+        progress["percent"] = min(100.0, progress["seconds"] * 100.0 / duration)
+        if speed:
+            progress["eta"] = max(duration - progress["seconds"], 0.0) / speed
+    return progress
+
+def run_ffmpeg(cmd, duration=None, on_progress=None, cancelled=None, timeout=None):
+    # 流式执行 ffmpeg：-progress 从 stdout 逐块读出进度交给 on_progress(dict)，
+    # stderr 只留最后几十行，内存占用与运行时长无关；cancelled() 返回 True 或超时就结束进程
+    cmd = [cmd[0], '-nostats', '-progress', 'pipe:1'] + list(cmd[1:])
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            **_popen_kwargs())
+    tail = deque(maxlen=ERROR_TAIL_LINES)
+    stopped = {}
+    finished = threading.Event()
+
+    def read_stderr():
+        for line in proc.stderr:
+            line = line.decode("utf-8", "replace").rstrip()
+            if line:
+                tail.append(line)
+
+    def watch():
+        deadline = time.monotonic() + timeout if timeout else None
+        while not finished.wait(WATCH_INTERVAL):
+            if cancelled and cancelled():
+                stopped["reason"] = "cancelled"
+            elif deadline and time.monotonic() > deadline:
+                stopped["reason"] = "timeout"
+            else:
+                continue
+            proc.kill()
+            return
+
+    readers = [threading.Thread(target=read_stderr, daemon=True, name="ffmpeg-stderr")]
+    if cancelled or timeout:
+        readers.append(threading.Thread(target=watch, daemon=True, name="ffmpeg-watch"))
+    for t in readers:
+        t.start()
+    try:
+        block = {}
+        for line in proc.stdout:
+            key, _, value = line.decode("utf-8", "replace").strip().partition("=")
+            block[key] = value
+            if key == "progress":
+                if on_progress:
+                    on_progress(_parse_progress(block, duration))
+                block = {}
+        proc.wait()
+    except BaseException:
+        # on_progress 里抛出的取消等异常：先结束 ffmpeg 再往外抛
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        finished.set()
+        for t in readers:
+            t.join()
+        proc.stdout.close()
+        proc.stderr.close()
+    if stopped.get("reason") == "cancelled":
+        raise JobCancelled()
+    if stopped.get("reason") == "timeout":
+        raise RuntimeError(f"ffmpeg 超时（超过 {timeout} 秒）")
+    if proc.returncode != 0:
+        raise RuntimeError("ffmpeg 执行失败: " + " | ".join(list(tail)[-ERROR_TAIL_SHOWN:]))
+
+def _clock(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}" if seconds >= 3600 \
+        else f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+def job_hooks(job):
+    # 把转码进度写进任务：进度条显示百分比，速度一栏显示倍速和剩余时间；暂停时阻塞读取进度，ffmpeg 随之停下
+    def on_progress(p):
+        job.checkpoint()
+        parts = []
+        if p["speed"]:
+            parts.append(f"{p['speed']:.2f}x")
+        if p["fps"]:
+            parts.append(f"{p['fps']:.0f}fps")
+        if p["eta"] is not None:
+            parts.append(f"剩余 {_clock(p['eta'])}")
+        job.update(progress=100 if p["done"] else p["percent"], message=" ".join(parts))
+    return {"on_progress": on_progress, "cancelled": lambda: job.cancelled}
+
+# ---------------- 探测后决定转码方式 ----------------
+COPY = "copy"     # 已是 H.264/yuv420p + AAC，只换封装
+AUDIO = "audio"   # 视频可直接复制，只重编码音频
+FULL = "full"     # 视频需要重编码
+
+MODE_TEXT = {COPY: "直接封装", AUDIO: "仅转音频", FULL: "完整转码"}
+
+MODE_ARGS = {
+    COPY: ['-c', 'copy'],
+    AUDIO: ['-c:v', 'copy', '-c:a', 'aac'],
+    FULL: ENCODE_ARGS,
+}
+
+# avc1.PPCCLL 中的 profile：66 Baseline / 77 Main / 88 Extended / 100 High，均为 8bit 4:2:0
+_AVC_420_PROFILES = {0x42, 0x4d, 0x58, 0x64}
+
+_DURATION_LINE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+_VIDEO_LINE = re.compile(r"Stream #\S+: Video: (\w+)[^,]*, (\w+)")
+_AUDIO_LINE = re.compile(r"Stream #\S+: Audio: (\w+)")
+
+def _probe_with_ffmpeg(source, headers=None):
+    # 没有 ffprobe 时的退路：ffmpeg -i 不给输出文件会报错退出，但 stderr 里已经列出了时长和各条流
+    cmd = [get_ffmpeg_path(), '-hide_banner']
+    if headers:
+        cmd += ['-headers', "".join(f"{k}: {v}\r\n" for k, v in headers.items())]
+    cmd += ['-i', source]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **_popen_kwargs())
+    text = result.stderr.decode("utf-8", "replace")
+    info = {"vcodec": None, "pix_fmt": None, "acodec": None, "duration": None}
+    m = _DURATION_LINE.search(text)
+    if m:
+        info["duration"] = int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3))
+    m = _VIDEO_LINE.search(text)
+    if m:
+        info["vcodec"], info["pix_fmt"] = m.group(1), m.group(2)
+    m = _AUDIO_LINE.search(text)
+    if m:
+        info["acodec"] = m.group(1)
+    if not (info["vcodec"] or info["acodec"]):
+        raise RuntimeError("ffmpeg 探测失败")
+    return info
+
+def probe_media(source, headers=None):
+    # 用 ffprobe 读取第一条视频流和音频流的编码信息
+    if not has_ffprobe():
+        return _probe_with_ffmpeg(source, headers)
+    cmd = [get_ffprobe_path(), '-v', 'error']
+    if headers:
+        cmd += ['-headers', "".join(f"{k}: {v}\r\n" for k, v in headers.items())]
+    cmd += ['-show_entries', 'stream=codec_type,codec_name,pix_fmt:format=duration', '-of', 'json', source]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **_popen_kwargs())
+    if result.returncode != 0:
+        raise RuntimeError("ffprobe 执行失败")
+    data = json.loads(result.stdout or b"{}")
+    info = {"vcodec": None, "pix_fmt": None, "acodec": None}
+    try:
+        info["duration"] = float(data["format"]["duration"])
+    except (KeyError, TypeError, ValueError):
+        info["duration"] = None
+    for stream in data.get("streams", []):
+        if stream.get("codec_type") == "video" and info["vcodec"] is None:
+            info["vcodec"] = stream.get("codec_name")
+            info["pix_fmt"] = stream.get("pix_fmt")
+        elif stream.get("codec_type") == "audio" and info["acodec"] is None:
+            info["acodec"] = stream.get("codec_name")
+    return info
+
+def media_duration(path):
+    # 成片时长（秒），算转码速度倍率用；探测失败返回 None
+    try:
+        return probe_media(path)["duration"]
+    except Exception:
+        return None
+
+def speed_factor(output_path, seconds):
+    # 转码速度倍率：成片时长 / 耗时，大于 1 表示比实时快
+    duration = media_duration(output_path)
+    return round(duration / seconds, 2) if duration and seconds else None
+
+def _codecs_from_format(fmt):
+    # 直接用 yt-dlp 给出的 codec 字符串判断，省掉一次 ffprobe；信息不全返回 None
+    vcodec = fmt.get("vcodec")
+    acodec = fmt.get("acodec")
+    if not vcodec or not acodec:
+        return None
+    info = {"vcodec": None, "pix_fmt": None, "acodec": None}
+    if vcodec != "none":
+        if not vcodec.startswith(("avc1", "avc3", "h264")):
+            info["vcodec"] = vcodec.split(".")[0]
+        else:
+            info["vcodec"] = "h264"
+            try:
+                profile = int(vcodec.split(".")[1][:2], 16)
+            except (IndexError, ValueError):
+                return None
+            info["pix_fmt"] = "yuv420p" if profile in _AVC_420_PROFILES else "unknown"
+    if acodec != "none":
+        info["acodec"] = "aac" if acodec.startswith(("mp4a", "aac")) else acodec.split(".")[0]
+    return info
+
+def plan_transcode(video, audio):
+    # video/audio 为 probe_media 风格的字典，返回 (方式, 原因)
+    if video.get("vcodec") != "h264":
+        return FULL, f"视频编码为 {video.get('vcodec') or '未知'}"
+    if video.get("pix_fmt") != "yuv420p":
+        return FULL, f"像素格式为 {video.get('pix_fmt') or '未知'}"
+    acodec = audio.get("acodec")
+    if acodec and acodec != "aac":
+        return AUDIO, f"视频已是 H.264，音频为 {acodec}"
+    return COPY, "已是 H.264/yuv420p + AAC"
+
+def _thread_args(mode, threads):
+    # 只有真正编码时才限制线程数，直接封装几乎不占 CPU
+    return ['-threads', str(threads)] if threads and mode != COPY else []
+
+def transcode_video(input_path, output_path, threads=None, **hooks):
+    # hooks 透传给 run_ffmpeg：on_progress / cancelled / timeout
+    duration = None
+    probed = {}
+    try:
+        probed = probe_media(input_path)
+        duration = probed["duration"]
+        mode, reason = plan_transcode(probed, probed)
+    except Exception as e:
+        mode, reason = FULL, f"探测失败({e})"
+    logger.info("转码方式 %s: %s (%s)", MODE_TEXT[mode], reason, input_path)
+    # 找关键帧要用 ffprobe，没有就整段编码
+    chunks = plan_chunks(duration, threads) if mode == FULL and has_ffprobe() else 1
+    if chunks > 1:
+        try:
+            chunked_transcode(input_path, output_path, duration, chunks, threads,
+                              acodec=probed.get("acodec"), **hooks)
+            return mode, reason + f"，分 {chunks} 段并行编码"
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logger.warning("分段编码失败，改为整段编码: %s", e)
+    cmd = ([get_ffmpeg_path(), '-i', input_path] + MODE_ARGS[mode] + _thread_args(mode, threads)
+           + ['-movflags', '+faststart', '-y', output_path])
+    run_ffmpeg(cmd, duration=duration, **hooks)
+    return mode, reason
+
+# ---------------- 长视频分段并行编码 ----------------
+# 单个 libx264 进程在多核机器上吃不满 CPU：长视频在关键帧处切成 N 段（不重编码），
+# 各段用相同参数并行编码，再无损拼接；音频整条单独处理一次，避免分段处出现 AAC 间隙
+CHUNK_MIN_DURATION = 600   # 秒，短于这个时长的视频不分段
+CHUNK_THREADS = 4          # 每个分段编码进程的线程数
+MAX_CHUNKS = 16
+
+VIDEO_ENCODE_ARGS = ['-c:v', 'libx264', '-pix_fmt', 'yuv420p']
+
+def plan_chunks(duration, threads=None):
+    # 分几段：按可用线程数每 CHUNK_THREADS 个线程一段，短视频不分
+    if not duration or duration < CHUNK_MIN_DURATION:
+        return 1
+    budget = threads or os.cpu_count() or 1
+    return max(1, min(MAX_CHUNKS, budget // CHUNK_THREADS))
+
+def keyframe_times(path):
+    # 只解码关键帧，拿到视频流所有关键帧的时间点
+    cmd = [get_ffprobe_path(), '-v', 'error', '-select_streams', 'v:0', '-skip_frame', 'nokey',
+           '-show_entries', 'frame=pts_time', '-of', 'csv=p=0', path]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **_popen_kwargs())
+    if result.returncode != 0:
+        raise RuntimeError("ffprobe 读取关键帧失败")
+    times = []
+    for line in result.stdout.decode("ascii", "replace").split():
+        try:
+            times.append(float(line.strip(",")))
+        except ValueError:
+            pass
+    return sorted(times)
+
+def split_points(keyframes, duration, chunks):
+    # 每个等分点取最近的关键帧；太近的合并掉，分段数可能比计划少
+    points = []
+    for i in range(1, chunks):
+        target = duration * i / chunks
+        t = min(keyframes, key=lambda k: abs(k - target))
+        if t - (points[-1] if points else 0.0) >= 1.0 and duration - t >= 1.0:
+            points.append(t)
+    return points
+
+def chunked_transcode(input_path, output_path, duration, chunks, threads=None, acodec=None,
+                      on_progress=None, cancelled=None, timeout=None):
+    # acodec 为原视频的音频编码（probe_media 结果），None 表示没有音轨；AAC 直接复制
+    points = split_points(keyframe_times(input_path), duration, chunks)
+    if not points:
+        raise RuntimeError("找不到合适的关键帧切分点")
+    ffmpeg = get_ffmpeg_path()
+    budget = threads or os.cpu_count() or 1
+    per_chunk = max(1, budget // (len(points) + 1))
+    workdir = tempfile.mkdtemp(prefix="chunks_", dir=os.path.dirname(os.path.abspath(output_path)))
+    stop = threading.Event()
+    done = {}
+    lock = threading.Lock()
+
+    def is_cancelled():
+        return stop.is_set() or bool(cancelled and cancelled())
+
+    def report(index, p):
+        # 各段进度合计成整条视频的进度
+        if not on_progress:
+            return
+        with lock:
+            done[index] = p
+            seconds = sum(d["seconds"] for d in done.values())
+            speed = sum(d["speed"] or 0 for d in done.values() if not d["done"]) or None
+            fps = sum(d["fps"] or 0 for d in done.values() if not d["done"]) or None
+        on_progress({"seconds": seconds, "fps": fps, "speed": speed, "done": False,
+                     "percent": min(100.0, seconds * 100.0 / duration),
+                     "eta": max(duration - seconds, 0.0) / speed if speed else None})
+
+    try:
+        # 1. 按关键帧切段（流复制，段边界就是关键帧）
+        pattern = os.path.join(workdir, "part%03d.mp4")
+        run_ffmpeg([ffmpeg, '-i', input_path, '-map', '0:v:0', '-c', 'copy', '-f', 'segment',
+                    '-segment_times', ",".join(f"{t:.6f}" for t in points), '-reset_timestamps', '1',
+                    '-y', pattern], cancelled=cancelled, timeout=timeout)
+        parts = sorted(f for f in os.listdir(workdir) if f.startswith("part"))
+        if len(parts) < 2:
+            raise RuntimeError("切段失败")
+        starts = [0.0] + points
+
+        # 2. 各段并行编码，音频整条单独一个进程
+        def encode(index, name):
+            src = os.path.join(workdir, name)
+            seg_duration = (starts[index + 1] if index + 1 < len(starts) else duration) - starts[index]
+            run_ffmpeg([ffmpeg, '-i', src] + VIDEO_ENCODE_ARGS + ['-threads', str(per_chunk), '-y',
+                        os.path.join(workdir, "enc_" + name)],
+                       duration=seg_duration, on_progress=lambda p: report(index, p),
+                       cancelled=is_cancelled, timeout=timeout)
+
+        audio_file = os.path.join(workdir, "audio.m4a") if acodec else None
+        with ThreadPoolExecutor(max_workers=len(parts) + 1, thread_name_prefix="chunk") as pool:
+            futures = [pool.submit(encode, i, name) for i, name in enumerate(parts)]
+            if audio_file:
+                audio_args = ['-c:a', 'copy'] if acodec == "aac" else ['-c:a', 'aac']
+                futures.append(pool.submit(run_ffmpeg, [ffmpeg, '-i', input_path, '-map', '0:a:0'] + audio_args
+                                           + ['-y', audio_file], cancelled=is_cancelled, timeout=timeout))
+            # 任何一段失败（或取消）就让其余进程一起停下
+            finished, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            errors = [f.exception() for f in finished if f.exception()]
+            if errors:
+                stop.set()
+                raise errors[0]
+
+        # 3. 无损拼接视频段，再把音频封装进去
+        list_file = os.path.join(workdir, "list.txt")
+        with open(list_file, "w", encoding="utf-8") as f:
+            for name in parts:
+                f.write(f"file 'enc_{name}'\n")
+        cmd = [ffmpeg, '-f', 'concat', '-safe', '0', '-i', list_file]
+        if audio_file:
+            cmd += ['-i', audio_file, '-map', '0:v:0', '-map', '1:a:0']
+        cmd += ['-c', 'copy', '-movflags', '+faststart', '-y', output_path]
+        run_ffmpeg(cmd, cancelled=cancelled, timeout=timeout)
+        if on_progress:
+            on_progress({"seconds": duration, "fps": None, "speed": None, "percent": 100.0, "eta": 0.0,
+                         "done": True})
+    except Exception:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# ---------------- 边下边转 ----------------
+def _input_args(fmt):
+    args = []
+    headers = fmt.get("http_headers") or {}
+    if headers:
+        args += ['-headers', "".join(f"{k}: {v}\r\n" for k, v in headers.items())]
+    return args + ['-i', fmt["url"]]
+
+def _probe_format(fmt):
+    return _codecs_from_format(fmt) or probe_media(fmt["url"], fmt.get("http_headers"))
+
+def plan_stream(formats):
+    try:
+        video = _probe_format(formats[0])
+        audio = _probe_format(formats[1]) if len(formats) > 1 else video
+        return plan_transcode(video, audio)
+    except Exception as e:
+        return FULL, f"探测失败({e})"
+
+def stream_transcode(formats, output_path, threads=None, plan=None, **hooks):
+    # formats 为 yt-dlp 选出的流（视频 [+ 音频]），ffmpeg 直接拉取远程流，
+    # 合并和编码在同一个进程里一次完成，编码与下载同时进行，不落中间文件；
+    # plan 是调用方已经算好的 plan_stream(formats)（按它决定要不要占转码池），不用再探测一遍
+    mode, reason = plan or plan_stream(formats)
+    logger.info("转码方式 %s: %s (%s)", MODE_TEXT[mode], reason, output_path)
+    cmd = [get_ffmpeg_path(), '-y']
+    for fmt in formats:
+        cmd += _input_args(fmt)
+    if len(formats) > 1:
+        cmd += ['-map', '0:v:0', '-map', '1:a:0']
+    else:
+        cmd += ['-map', '0:v:0', '-map', '0:a?']
+    cmd += MODE_ARGS[mode] + _thread_args(mode, threads) + ['-movflags', '+faststart', output_path]
+    try:
+        run_ffmpeg(cmd, duration=formats[0].get("duration"), **hooks)
+    except Exception:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    return mode, reason
+
+# ---------------- 转码线程池 ----------------
+class TranscodePool:
+    # 每个任务就是一个 ffmpeg 子进程，这里只负责限流：
+    # 并发数按 CPU 核数决定，每路编码分到 cpu_count / 并发数 个线程，避免多个 libx264 抢核
+    def __init__(self, max_workers=None):
+        cores = os.cpu_count() or 2
+        self.max_workers = max_workers or max(1, cores // 4)
+        self.threads_per_job = max(1, cores // self.max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="transcode")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self._busy = 0.0
+        self._active_since = {}
+        self._sample_at = time.time()
+
+    def submit(self, func, *args):
+        # func(*args, threads=...)
+        with self._lock:
+            self.queued += 1
+        return self._executor.submit(self._run, func, args)
+
+    def run(self, job, func, *args):
+        # 在调用方线程里等一个槽位并等到 func 做完：边下边转的整段编码要同时占着下载槽位和编码槽位；
+        # 还在排队时任务被取消就直接退出
+        future = self.submit(func, *args)
+        while True:
+            try:
+                return future.result(timeout=WATCH_INTERVAL)
+            except FutureTimeout:
+                if job.cancelled and future.cancel():
+                    with self._lock:
+                        self.queued -= 1
+                    raise JobCancelled()
+
+    def _run(self, func, args):
+        key = threading.get_ident()
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self._active_since[key] = time.time()
+            # 没人排队时空闲槽位的线程也借给这个任务，单个长视频能分段吃满所有核
+            idle = 0 if self.queued else self.max_workers - self.active
+            threads = self.threads_per_job * (1 + max(0, idle))
+        try:
+            return func(*args, threads=threads)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self._busy += time.time() - max(self._active_since.pop(key), self._sample_at)
+
+    def stats(self):
+        # 返回排队数、进行中数量和自上次调用以来的利用率
+        now = time.time()
+        with self._lock:
+            busy = self._busy + sum(now - max(t, self._sample_at) for t in self._active_since.values())
+            elapsed = max(now - self._sample_at, 1e-6)
+            utilization = min(1.0, busy / (elapsed * self.max_workers))
+            self._busy = 0.0
+            self._sample_at = now
+            return {"queued": self.queued, "active": self.active, "workers": self.max_workers,
+                    "threads_per_job": self.threads_per_job, "utilization": utilization}
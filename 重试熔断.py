@@ -0,0 +1,208 @@
+﻿import re
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+from 会话池 import site_of
+from 任务队列 import JobCancelled
+from 任务指标 import metrics
+
+logger = logging.getLogger(__name__)
+
+# 错误分类
+RATE_LIMITED = "rate_limited"   # 429 / 被限流：退避重试，计入熔断
+TRANSIENT = "transient"         # 5xx、超时、连接断开：退避重试，计入熔断
+AUTH = "auth"                   # 401/403、需要登录：换个会话（游客令牌）再试一次
+PERMANENT = "permanent"         # 404、不支持的链接、没有视频：不重试
+
+ERROR_TEXT = {
+    RATE_LIMITED: "被限流",
+    TRANSIENT: "网络错误",
+    AUTH: "鉴权失败",
+    PERMANENT: "失败",
+}
+
+MAX_ATTEMPTS = 4           # 含第一次
+AUTH_ATTEMPTS = 2
+BACKOFF_BASE = 2.0         # 重试退避 2s、4s、8s ...（带随机抖动），最多 60s
+BACKOFF_MAX = 60.0
+BREAKER_THRESHOLD = 3      # 同一站点连续几次限流 / 网络错误就熔断
+BREAKER_COOLDOWN = 30.0    # 熔断后暂停多久再放一个请求试探；试探失败翻倍，最多 5 分钟
+BREAKER_MAX_COOLDOWN = 300.0
+RETRY_AFTER_MAX = BREAKER_MAX_COOLDOWN   # 服务器给的 Retry-After 最多照办这么久（解析线程里的等待不能取消）
+WAIT_STEP = 1.0            # 熔断期间每隔多久看一次（顺便响应取消）
+
+_HTTP_STATUS = re.compile(r"HTTP Error (\d{3})")
+_RATE_LIMIT_WORDS = ("rate limit", "too many requests", "rate-limit")
+_AUTH_WORDS = ("login required", "log in", "sign in", "authorization", "authentication", "cookies")
+_TRANSIENT_WORDS = ("timed out", "timeout", "connection reset", "connection aborted", "connection refused",
+                    "temporarily", "temporary failure", "remote end closed", "incomplete read", "eof occurred")
+
+
+def _chain(error):
+    # yt-dlp 的错误层层包装：DownloadError.exc_info -> ExtractorError.cause -> HTTPError
+    seen = []
+    while error is not None and error not in seen:
+        seen.append(error)
+        exc_info = getattr(error, "exc_info", None)
+        error = (getattr(error, "cause", None)
+                 or (exc_info[1] if isinstance(exc_info, tuple) and len(exc_info) > 1 else None)
+                 or error.__cause__ or error.__context__)
+    return seen
+
+
+def _retry_after(response):
+    value = None
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return min(float(value), RETRY_AFTER_MAX)
+    try:
+        return min(max(0.0, parsedate_to_datetime(value).timestamp() - time.time()), RETRY_AFTER_MAX)
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(error):
+    # 返回 (错误类别, 服务器要求等待的秒数或 None)
+    from yt_dlp.networking.exceptions import TransportError
+    status = None
+    retry_after = None
+    transport = False
+    for e in _chain(error):
+        code = getattr(e, "status", None) or getattr(e, "code", None)
+        if isinstance(code, int) and 100 <= code < 600:
+            status = status or code
+            retry_after = retry_after or _retry_after(getattr(e, "response", None) or e)
+        if isinstance(e, (TransportError, TimeoutError, ConnectionError)):
+            transport = True
+    message = " ".join(str(e) for e in _chain(error)).lower()
+    if status is None:
+        m = _HTTP_STATUS.search(message)
+        status = int(m.group(1)) if m else None
+    if status == 429 or any(w in message for w in _RATE_LIMIT_WORDS):
+        return RATE_LIMITED, retry_after
+    if status in (401, 403) or any(w in message for w in _AUTH_WORDS):
+        return AUTH, None
+    if (status is not None and 500 <= status < 600) or status == 408:
+        return TRANSIENT, retry_after
+    if status is None and (transport or any(w in message for w in _TRANSIENT_WORDS)):
+        return TRANSIENT, None
+    return PERMANENT, None
+
+
+def backoff(attempt):
+    # 第 attempt 次重试前等待的秒数：指数退避 + 全抖动，避免一批任务同时重试
+    return random.uniform(0.5, 1.0) * min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+
+
+def _sleep(seconds, job=None):
+    if job is not None:
+        job.sleep(seconds)
+    else:
+        time.sleep(seconds)
+
+
+class _HostState:
+    def __init__(self):
+        self.failures = 0
+        self.open_until = 0.0
+        self.cooldown = BREAKER_COOLDOWN
+        self.probing = False
+
+
+# --------------------
+# 重试与熔断：解析和下载都经过这里。按错误类别决定重试与否，带抖动的指数退避，服务器给了 Retry-After 就照办；
+# 同一站点连续限流 / 出错时熔断，暂停这个站点的所有请求，冷却后只放一个试探，成功才恢复
+# --------------------
+class Resilience:
+    def __init__(self, threshold=BREAKER_THRESHOLD):
+        self.threshold = threshold
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _state(self, host):
+        if host not in self._hosts:
+            self._hosts[host] = _HostState()
+        return self._hosts[host]
+
+    def is_open(self, url):
+        with self._lock:
+            return self._state(site_of(url)).open_until > time.time()
+
+    def wait(self, host, job=None):
+        # 熔断期间挂起调用方（任务可以取消）；冷却结束后第一个调用方去试探，其余的等试探结果
+        while True:
+            with self._lock:
+                st = self._state(host)
+                now = time.time()
+                if st.open_until <= now and not st.probing:
+                    if st.failures >= self.threshold:
+                        st.probing = True
+                    return
+                delay = max(st.open_until - now, 0.0)
+            if job is not None:
+                job.update(message=f"⏸ {host} 暂停中，{delay:.0f} 秒后重试")
+            _sleep(min(delay, WAIT_STEP) or WAIT_STEP, job)
+
+    def success(self, host):
+        with self._lock:
+            st = self._state(host)
+            if st.failures >= self.threshold:
+                logger.info("%s 恢复", host)
+            st.failures = 0
+            st.probing = False
+            st.cooldown = BREAKER_COOLDOWN
+
+    def failure(self, host, kind, retry_after=None):
+        with self._lock:
+            st = self._state(host)
+            probing, st.probing = st.probing, False
+            if kind not in (RATE_LIMITED, TRANSIENT):
+                return
+            st.failures += 1
+            now = time.time()
+            if retry_after:
+                # 服务器明确说了要等多久：整个站点一起等
+                st.open_until = max(st.open_until, now + retry_after)
+            if probing or st.failures >= self.threshold:
+                st.open_until = max(st.open_until, now + st.cooldown)
+                logger.warning("%s 连续出错 %d 次，暂停 %.0f 秒", host, st.failures, st.open_until - now)
+                if probing:
+                    st.cooldown = min(BREAKER_MAX_COOLDOWN, st.cooldown * 2)
+
+    def call(self, url, func, *args, job=None, attempts=MAX_ATTEMPTS, host=None, **kwargs):
+        # 在调用方线程里执行 func(*args, **kwargs)，可重试的错误按策略重试，最后一次的错误原样抛出；
+        # 熔断默认按链接所在站点算，host 可以指定别的（比如下载时的 CDN 主机）
+        host = host or site_of(url)
+        for attempt in range(attempts):
+            self.wait(host, job)
+            try:
+                result = func(*args, **kwargs)
+            except JobCancelled:
+                self.failure(host, PERMANENT)
+                raise
+            except Exception as e:
+                kind, retry_after = classify(e)
+                self.failure(host, kind, retry_after)
+                if (job is not None and job.cancelled) or kind == PERMANENT or attempt + 1 >= attempts \
+                        or (kind == AUTH and attempt + 1 >= AUTH_ATTEMPTS):
+                    raise
+                delay = retry_after if retry_after is not None else backoff(attempt)
+                logger.info("%s %s，%.1f 秒后第 %d 次重试: %s", host, ERROR_TEXT[kind], delay, attempt + 1, e)
+                metrics.observe("retry", delay, host=host, kind=kind, attempt=attempt + 1)
+                if job is not None:
+                    job.update(message=f"{ERROR_TEXT[kind]}，{delay:.0f} 秒后重试")
+                _sleep(delay, job)
+                continue
+            self.success(host)
+            return result
+
+
+resilience = Resilience()